@@ -1,5 +1,3 @@
-from tqdm import tqdm
-import pandas as pd
 from sklearn.linear_model import LogisticRegression
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.naive_bayes import GaussianNB, MultinomialNB, ComplementNB, BernoulliNB, CategoricalNB
@@ -7,8 +5,7 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
-from modeling_preperation import x_train, x_test, y_train, y_test
-import modeling_functions as mf
+import PYTHON.model_benchmarking as mb
 
 path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/CSV/'
 
@@ -31,15 +28,11 @@ models = [
     MLPClassifier(solver='adam')
 ]
 
-scores = []
-for model in tqdm(models):
-    try:
-        scores.append(mf.classification_evaluation(model, x_train, x_test, y_train, y_test))
-    except:
-        scores.append(None)
+if __name__ == '__main__':
+    # only the main process prepares the data, the worker processes are sent it when they start
+    from PYTHON.modeling_preperation import x_train, x_test, y_train, y_test
 
-model_scores = pd.DataFrame(scores, columns=['Mean CV Score', 'Train Score', 'Test Score', 'Precision Score',
-                                             'Recall Score', 'f1 Score', 'Time Taken (s)'])
-model_scores.insert(0, 'Model', models)
+    model_scores = mb.benchmark_models(models, x_train, x_test, y_train, y_test, path + 'model_benchmark_cache.json',
+                                       timeout=3600)
 
-model_scores.to_csv(path + 'model_scores.csv', index=False)
+    model_scores.to_csv(path + 'model_scores.csv', index=False)
@@ -1,113 +1,361 @@
 import pandas as pd
+import numpy as np
+import heapq
 from itertools import combinations
 from collections import Counter
+from scipy.optimize import milp, LinearConstraint, Bounds
 import os
 import PYTHON.data_cleaning_functions as dcf
 
+squad_quotas = {'GK': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
 
-def get_best_squad(constraint, rows_to_check=30):
+sort_columns = ['predicted_point_range', 'prob_3', 'prob_2', 'prob_1', 'prob_0']
+
+# index of the first goalkeeper, defender, midfielder and forward in an ordered squad, and the end of the squad
+position_starts = np.cumsum([0] + list(squad_quotas.values()))
+
+# (goalkeepers, defenders, midfielders, forwards) of every valid starting 11 formation
+formations = [(1, defenders, midfielders, 10 - defenders - midfielders) for defenders in range(3, 6)
+              for midfielders in range(3, 6) if 1 <= 10 - defenders - midfielders <= 3]
+
+
+def squad_score(points, probs):
     """
-    Get the best predicted FPL squad for the upcoming gameweek, given a constraint.
+    Combines predicted points and probability of a high return into one score that orders squads by points first and
+    then by probability. As a squad's summed prob_3 is always below 16, the points always dominate.
+
+    :param points: The (sum of) predicted point ranges.
+    :param probs: The (sum of) probabilities of the highest point range.
+    :return: The combined score.
+    """
+    return points * 16 + probs
+
+
+def position_candidates(predictions, rows_to_check=None):
+    """
+    Sorts the players in each position by their predictions, best first.
+
+    :param predictions: The predictions dataframe.
+    :param rows_to_check: Number of players to keep in each position. Default is None, which keeps every player.
+    :return: Dictionary of position: list of the players (as lists of their prediction values).
+    """
+    return {position: [list(row) for i, row in predictions[predictions['position'] == position].sort_values(
+        by=sort_columns, ascending=False)[:rows_to_check].iterrows()] for position in squad_quotas}
+
+
+def combination_aggregates(players, quota):
+    """
+    Every combination of players that fills a position quota, together with the combinations summed information,
+    sorted by the combinations score, best first.
+
+    :param players: List of the players in a position.
+    :param quota: The number of players needed in that position.
+    :return: List of (combination, sum_of_values, squad_score, team_counts)
+    """
+    aggregates = []
+    for combination in combinations(players, quota):
+        values, points, probs_3, teams = dcf.sum_of_information(combination)
+        aggregates.append((combination, values, squad_score(points, probs_3), Counter(teams)))
+    return sorted(aggregates, key=lambda x: x[2], reverse=True)
+
+
+def within_constraint(constraint, team_value, team_counts):
+    """
+    Whether a squad satisfies a constraint.
 
     :param constraint: {'budget', 'team', 'all', 'none'}
-                        What constraints to put on the team.
-                        'budget': Get a squad that is within the application budget constraint (£100m)
-                        'team': Get a squad within the team constraint, i.e. max 3 players from the same team
-                        'all': Have both budget and team constraints on the best squad. Allows you to use team in application.
-                        'none': Have no team constraints. Get the squad with the highest predicted points return.
-    :param rows_to_check: Number of rows to use in the combinations. Warning the larger the number, the time to return squad gets exponentially larger.
+    :param team_value: The total value of the squad.
+    :param team_counts: Counter of the number of players from each team in the squad.
+    :return: Boolean.
     """
-    
-    if constraint not in {'budget', 'team', 'all', 'none'}:
-        raise ValueError("Constraint variable not within required values: {'budget', 'team', 'all', 'none'}")
+    if constraint in {'budget', 'all'} and team_value > 1000:
+        return False
+    if constraint in {'team', 'all'} and max(team_counts.values()) > 3:
+        return False
+    return True
 
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/CSV/predictions/'
 
-    predictions = pd.read_csv(path + 'predictions.csv')
+def combinations_top_squads(predictions, constraints, number_of_squads=1, rows_to_check=30):
+    """
+    Enumerate the best squads for each constraint from the combinations of the top players in each position. The
+    combinations and their summed information are built once and the squads are walked once for all constraints.
 
-    next_fixtures = pd.read_csv(path + 'next_fixtures.csv')
-    next_round = max(next_fixtures['round']) + 1
+    Only the best number_of_squads squads are kept in a heap for each constraint, and as the combinations in each
+    position are sorted best first, a branch is cut as soon as its best possible score cannot beat the worst squad
+    kept for every constraint.
 
-    positions = {'Goalkeepers': (predictions[predictions['position'] == 'GK'], 2),
-                 'Defenders': (predictions[(predictions['position'] == 'DEF')], 5),
-                 'Midfielders': (predictions[predictions['position'] == 'MID'], 5),
-                 'Forwards': (predictions[predictions['position'] == 'FWD'], 3)}
-
-    for position, players in positions.items():
-        players_as_lists = [list(row) for i, row in players[0].sort_values(by=['predicted_point_range', 'prob_3', 'prob_2',
-                                                                               'prob_1', 'prob_0'], ascending=False)[:rows_to_check].iterrows()]
-        positions[position] = combinations(players_as_lists, players[1])
-
-    team_combs = []
-    for gks in positions['Goalkeepers']:
-        gks_value, gks_points, gks_probs, gks_teams = dcf.sum_of_information(gks)
-        for defs in positions['Defenders']:
-            defs_value, defs_points, defs_probs, defs_teams = dcf.sum_of_information(defs)
-            for mids in positions['Midfielders']:
-                mids_value, mids_points, mids_probs, mids_teams = dcf.sum_of_information(mids)
-                for fwds in positions['Forwards']:
-                    fwds_value, fwds_points, fwds_probs, fwds_teams = dcf.sum_of_information(fwds)
-    
-                    team_value = sum([gks_value, defs_value, mids_value, fwds_value])
-                    team_points = sum([gks_points, defs_points, mids_points, fwds_points])
-                    team_probs = sum([gks_probs, defs_probs, mids_probs, fwds_probs])
-                    all_teams_counts = Counter(gks_teams + defs_teams + mids_teams + fwds_teams)
-    
-                    if (constraint == 'all') & (team_value <= 1000) & (max(all_teams_counts.values()) <= 3):
-                        team_combs.append([gks, defs, mids, fwds, team_value, team_points, team_probs])
-                    elif (constraint == 'team') & (max(all_teams_counts.values()) <= 3):
-                        team_combs.append([gks, defs, mids, fwds, team_value, team_points, team_probs])
-                    elif (constraint == 'budget') & (team_value <= 1000):
-                        team_combs.append([gks, defs, mids, fwds, team_value, team_points, team_probs])
-                    elif constraint == 'none':
-                        team_combs.append([gks, defs, mids, fwds, team_value, team_points, team_probs])
-
-    if not team_combs:
-        print('{} Has No Team Combinations Within Constraint.'.format(constraint))
-    else:
-        sorted_team_combs = sorted(team_combs, key=lambda x: (x[-2], x[-1]), reverse=True)
+    :param predictions: The predictions dataframe.
+    :param constraints: Iterable of constraints from {'budget', 'team', 'all', 'none'}.
+    :param number_of_squads: The number of squads to return for each constraint.
+    :param rows_to_check: Number of rows to use in the combinations.
+    :return: Dictionary of constraint: list of up to number_of_squads squads (lists of the 15 players), best first.
+    """
+    candidates = position_candidates(predictions, rows_to_check)
+    positions = [combination_aggregates(candidates[position], quota) for position, quota in squad_quotas.items()]
+    if not all(positions):
+        return {constraint: [] for constraint in constraints}
+
+    # best possible score of the positions still to be picked, after picking each position
+    remaining = [sum(position[0][2] for position in positions[i + 1:]) for i in range(len(positions))]
 
-        best_squad = []
-        for i in range(4):
-            player_names = [player for player in [position for position in sorted_team_combs[0][i]]]
-            best_squad = best_squad + player_names
+    heaps = {constraint: [] for constraint in constraints}
+    found = 0
 
-        all_starting_combs = combinations(best_squad, 11)
+    def threshold():
+        if any(len(heap) < number_of_squads for heap in heaps.values()):
+            return -np.inf
+        return min(heap[0][0] for heap in heaps.values())
 
-        possible_starting_11s = []
-        for team in all_starting_combs:
-            positions = [position[2] for position in team]
-            position_counts = Counter(positions)
-            if position_counts['GK'] == 1:
-                if position_counts['DEF'] >= 3:
-                    if position_counts['MID'] >= 3:
-                        if position_counts['FWD'] >= 1:
-                            possible_starting_11s.append([player for player in team])
+    for gks, gks_value, gks_score, gks_teams in positions[0]:
+        if gks_score + remaining[0] <= threshold():
+            break
+        for defs, defs_value, defs_score, defs_teams in positions[1]:
+            if gks_score + defs_score + remaining[1] <= threshold():
+                break
+            for mids, mids_value, mids_score, mids_teams in positions[2]:
+                if gks_score + defs_score + mids_score + remaining[2] <= threshold():
+                    break
+                for fwds, fwds_value, fwds_score, fwds_teams in positions[3]:
+                    team_score = gks_score + defs_score + mids_score + fwds_score
+                    if team_score <= threshold():
+                        break
 
-        possible_starting_11s_stats = []
-        for teams in possible_starting_11s:
-            team_value, team_points, team_probs, team_teams = dcf.sum_of_information(teams)
-            possible_starting_11s_stats.append((team_points, team_probs))
+                    team_value = gks_value + defs_value + mids_value + fwds_value
+                    all_teams_counts = gks_teams + defs_teams + mids_teams + fwds_teams
 
-        teams_df = pd.DataFrame(possible_starting_11s)
-        teams_df[['Team Points', 'Team Probs']] = possible_starting_11s_stats
+                    found += 1
+                    for constraint, heap in heaps.items():
+                        if len(heap) == number_of_squads and team_score <= heap[0][0]:
+                            continue
+                        if not within_constraint(constraint, team_value, all_teams_counts):
+                            continue
+                        # ties keep the squad found first, so later squads sort lower
+                        squad = (team_score, -found, gks + defs + mids + fwds)
+                        if len(heap) < number_of_squads:
+                            heapq.heappush(heap, squad)
+                        else:
+                            heapq.heapreplace(heap, squad)
 
-        best_starting_11 = list(teams_df.sort_values(by=['Team Points', 'Team Probs'], ascending=False).reset_index().iloc[0, :][:12])[1:]
+    return {constraint: [list(squad[2]) for squad in sorted(heap, reverse=True)]
+            for constraint, heap in heaps.items()}
+
+
+def milp_top_squads(predictions, constraints, number_of_squads=1, budget=1000, current_squad=None, transfers=0):
+    """
+    Solve for the provably best squads for each constraint over the full player pool as a binary integer program. Each
+    player is a 0/1 variable, the squad must fill the 2/5/5/3 position quota and contain each player at most once, and
+    the constraint adds the budget and/or the max 3 players per team rows. The constraint matrix is built once and each
+    constraint solves with the rows it needs.
+
+    Further squads are found in order by re-solving with a cut that stops any previous squad from being picked again.
+
+    :param predictions: The predictions dataframe.
+    :param constraints: Iterable of constraints from {'budget', 'team', 'all', 'none'}.
+    :param number_of_squads: The number of squads to return for each constraint.
+    :param budget: The most the squad can be worth, in the same units as the values. Default is 1000 (£100m).
+    :param current_squad: List of the names of the players in a current squad, to find the best transfers for. Every
+                          player in it must be in the predictions. Default is None, which picks a squad from scratch.
+    :param transfers: The most players that can be transferred out of the current squad.
+    :return: Dictionary of constraint: list of up to number_of_squads squads (lists of the 15 players), best first.
+    """
+    players = predictions.sort_values(by=sort_columns, ascending=False).reset_index(drop=True)
+    objective = -squad_score(players['predicted_point_range'], players['prob_3']).to_numpy()
+
+    squad_rows = [(players['position'] == position, quota, quota) for position, quota in squad_quotas.items()]
+    squad_rows += [(players['name'] == name, 0, 1)
+                   for name in players['name'][players['name'].duplicated()].unique()]
+    if current_squad is not None:
+        squad_size = sum(squad_quotas.values())
+        squad_rows += [(players['name'].isin(current_squad), squad_size - transfers, squad_size)]
+    budget_rows = [(players['value'], -np.inf, budget)]
+    team_rows = [(players['plays_for'] == team, 0, 3) for team in players['plays_for'].unique()]
+
+    squads = {}
+    for constraint in constraints:
+        rows = squad_rows + (budget_rows if constraint in {'budget', 'all'} else []) + \
+               (team_rows if constraint in {'team', 'all'} else [])
+        squads[constraint] = []
+
+        while len(squads[constraint]) < number_of_squads:
+            matrix, lower, upper = zip(*rows)
+            result = milp(objective, constraints=LinearConstraint(np.array(matrix, dtype=float), lower, upper),
+                          integrality=np.ones(len(players)), bounds=Bounds(0, 1), options={'mip_rel_gap': 0})
+            if not result.success:
+                break
+
+            picked = np.round(result.x) == 1
+            chosen = players[picked]
+            squads[constraint].append([list(row) for position in squad_quotas
+                                       for i, row in chosen[chosen['position'] == position].iterrows()])
+            rows = rows + [(picked, 0, sum(squad_quotas.values()) - 1)]
+    return squads
+
+
+def starting_11s(points, probs):
+    """
+    Picks the best starting 11 and captain for a batch of squads at once. Every squad must be ordered with its 2
+    goalkeepers, 5 defenders, 5 midfielders and 3 forwards in that order. The starting 11 is the best 1 goalkeeper and
+    the best players for the highest scoring valid formation, and the captain is the starter with the highest prob_3.
+
+    :param points: Array of the predicted point ranges with shape (number_of_squads, 15).
+    :param probs: Array of the probabilities of the highest point range with shape (number_of_squads, 15).
+    :return: (starting_11s_as_boolean_array, captain_indexes, starting_11_scores_with_captain_doubled)
+    """
+    points = np.asarray(points, dtype=float)
+    probs = np.asarray(probs, dtype=float)
+    scores = squad_score(points, probs)
+    number_of_squads = len(scores)
 
-        subs = dcf.difference_between_lists(best_starting_11, best_squad)
+    orders, cumulative_scores = [], []
+    for start, end in zip(position_starts[:-1], position_starts[1:]):
+        order = np.argsort(-scores[:, start:end], axis=1, kind='stable')
+        orders.append(order)
+        cumulative_scores.append(np.hstack([np.zeros((number_of_squads, 1)),
+                                            np.cumsum(np.take_along_axis(scores[:, start:end], order, axis=1), axis=1)]))
 
-        best_starting_11_df = pd.DataFrame(best_starting_11, columns=predictions.columns)
+    formation_scores = np.stack([sum(cumulative_scores[i][:, count] for i, count in enumerate(formation))
+                                 for formation in formations], axis=1)
+    counts = np.array(formations)[np.argmax(formation_scores, axis=1)]
 
-        subs_df = pd.DataFrame(subs, columns=predictions.columns)
-        sub_gk = subs_df.iloc[0, :].copy()
-        sub_gk['position'] = 'SubGK'
-        out_subs = subs_df.iloc[1:, :].copy()
-        out_subs.sort_values(by=['predicted_point_range', 'prob_3', 'prob_2', 'prob_1', 'prob_0'], ascending=False, inplace=True)
-        out_subs['position'] = ['Sub1', 'Sub2', 'Sub3']
+    starting = np.zeros(scores.shape, dtype=bool)
+    for i, (start, end) in enumerate(zip(position_starts[:-1], position_starts[1:])):
+        ranks = np.argsort(orders[i], axis=1)
+        starting[:, start:end] = ranks < counts[:, [i]]
 
-        fpl_squad = pd.concat([best_starting_11_df, pd.DataFrame(sub_gk).T, out_subs]).set_index('position')
+    captains = np.argmax(np.where(starting, probs, -np.inf), axis=1)
+    rows = np.arange(number_of_squads)
+    starting_scores = formation_scores.max(axis=1) + scores[rows, captains]
+    return starting, captains, starting_scores
 
-        fpl_squad["captain"] = [1 if prob == max(best_starting_11_df['prob_3']) else 0 for prob in fpl_squad['prob_3']]
 
-        os.mkdir(path + '{}'.format(next_round))
-        fpl_squad.to_csv(path + '{rou}/best_squad_{con}.csv'.format(rou=next_round, con=constraint))
+def rank_squads(squads):
+    """
+    Sorts squads by the score of their best starting 11 with the captain's points doubled, best first.
+
+    :param squads: List of squads (lists of the 15 players), each ordered goalkeepers, defenders, midfielders, forwards.
+    :return: The sorted list of squads.
+    """
+    if not squads:
+        return squads
+    squads_array = np.array([[(player[5], player[9]) for player in squad] for squad in squads], dtype=float)
+    starting, captains, starting_scores = starting_11s(squads_array[:, :, 0], squads_array[:, :, 1])
+    return [squads[i] for i in np.argsort(-starting_scores, kind='stable')]
+
+
+def squad_lineup(best_squad, columns):
+    """
+    Picks the best starting 11, substitutes and captain from a squad.
+
+    :param best_squad: List of the 15 players (as lists of their prediction values), ordered goalkeepers, defenders,
+                       midfielders, forwards.
+    :param columns: The columns of the predictions dataframe.
+    :return: Dataframe of the squad indexed by the starting positions and then 'SubGK', 'Sub1', 'Sub2', 'Sub3', with a
+             'captain' column.
+    """
+    squad_df = pd.DataFrame(best_squad, columns=columns)
+    starting, captains, starting_scores = starting_11s([squad_df['predicted_point_range']], [squad_df['prob_3']])
+
+    best_starting_11_df = squad_df[starting[0]]
+
+    subs_df = squad_df[~starting[0]]
+    sub_gk = subs_df.iloc[0, :].copy()
+    sub_gk['position'] = 'SubGK'
+    out_subs = subs_df.iloc[1:, :].copy()
+    out_subs.sort_values(by=sort_columns, ascending=False, inplace=True)
+    out_subs['position'] = ['Sub1', 'Sub2', 'Sub3']
+
+    fpl_squad = pd.concat([best_starting_11_df, pd.DataFrame(sub_gk).T, out_subs])
+    fpl_squad['captain'] = (fpl_squad.index == captains[0]).astype(int)
+    return fpl_squad.set_index('position')
+
+
+def save_squad(best_squad, columns, path, file_name):
+    """
+    Picks the best starting 11, substitutes and captain from a squad and saves it as a CSV.
+
+    :param best_squad: List of the 15 players (as lists of their prediction values), ordered goalkeepers, defenders,
+                       midfielders, forwards.
+    :param columns: The columns of the predictions dataframe.
+    :param path: The path of the round directory to save the squad to.
+    :param file_name: The name of the CSV file.
+    """
+    fpl_squad = squad_lineup(best_squad, columns)
+
+    os.makedirs(path, exist_ok=True)
+    fpl_squad.to_csv(path + file_name)
+
+
+def get_best_squads(constraints=('budget', 'team', 'all', 'none'), rows_to_check=30, method='milp', number_of_squads=1,
+                    rank_by='squad', candidate_squads=50, path=None):
+    """
+    Get the best predicted FPL squads for the upcoming gameweek for several constraints in one pass. The predictions
+    are read and the candidate players are prepared once, and shared between all of the constraints.
+
+    :param constraints: Iterable of constraints from {'budget', 'team', 'all', 'none'}. Default is all four.
+                        See get_best_squad for what each constraint means.
+    :param rows_to_check: Number of rows to use in the combinations. Only used by the 'combinations' method.
+    :param method: {'milp', 'combinations'}
+                   'milp': Solve exactly over every player in the predictions as an integer program. Takes seconds.
+                   'combinations': Brute-force the combinations of the top rows_to_check players in each position.
+    :param number_of_squads: The number of squads to save for each constraint. The best squad is saved as
+                             best_squad_{constraint}.csv and the alternatives as best_squad_{constraint}_{rank}.csv.
+    :param rank_by: {'squad', 'starting_11'}
+                    'squad': Rank the squads by the predictions of all 15 players.
+                    'starting_11': Rank the best candidate_squads squads by their best starting 11 with the captain's
+                                   points doubled, i.e. the points the squad would actually score.
+    :param candidate_squads: Number of squads to re-rank for each constraint when rank_by is 'starting_11'.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
+    if not set(constraints) <= {'budget', 'team', 'all', 'none'}:
+        raise ValueError("Constraint variable not within required values: {'budget', 'team', 'all', 'none'}")
+    if method not in {'milp', 'combinations'}:
+        raise ValueError("Method variable not within required values: {'milp', 'combinations'}")
+    if rank_by not in {'squad', 'starting_11'}:
+        raise ValueError("Rank variable not within required values: {'squad', 'starting_11'}")
+
+    path = (path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/') + 'CSV/predictions/'
+
+    predictions = pd.read_csv(path + 'predictions.csv')
+
+    next_fixtures = pd.read_csv(path + 'next_fixtures.csv')
+    next_round = max(next_fixtures['round']) + 1
+
+    squads_to_find = max(number_of_squads, candidate_squads) if rank_by == 'starting_11' else number_of_squads
+    if method == 'milp':
+        top_squads = milp_top_squads(predictions, constraints, squads_to_find)
+    else:
+        top_squads = combinations_top_squads(predictions, constraints, squads_to_find, rows_to_check)
+    if rank_by == 'starting_11':
+        top_squads = {constraint: rank_squads(squads)[:number_of_squads] for constraint, squads in top_squads.items()}
+
+    for constraint, squads in top_squads.items():
+        if not squads:
+            print('{} Has No Team Combinations Within Constraint.'.format(constraint))
+        for rank, squad in enumerate(squads, start=1):
+            file_name = 'best_squad_{}.csv'.format(constraint) if rank == 1 else \
+                'best_squad_{con}_{ran}.csv'.format(con=constraint, ran=rank)
+            save_squad(squad, predictions.columns, path + '{}/'.format(next_round), file_name)
+
+
+def get_best_squad(constraint, rows_to_check=30, method='milp', path=None):
+    """
+    Get the best predicted FPL squad for the upcoming gameweek, given a constraint.
+
+    :param constraint: {'budget', 'team', 'all', 'none'}
+                        What constraints to put on the team.
+                        'budget': Get a squad that is within the application budget constraint (£100m)
+                        'team': Get a squad within the team constraint, i.e. max 3 players from the same team
+                        'all': Have both budget and team constraints on the best squad. Allows you to use team in application.
+                        'none': Have no team constraints. Get the squad with the highest predicted points return.
+    :param rows_to_check: Number of rows to use in the combinations. Warning the larger the number, the time to return squad gets exponentially larger.
+                          Only used by the 'combinations' method.
+    :param method: {'milp', 'combinations'}
+                   'milp': Solve exactly over every player in the predictions as an integer program. Takes seconds.
+                   'combinations': Brute-force the combinations of the top rows_to_check players in each position.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
+
+    if constraint not in {'budget', 'team', 'all', 'none'}:
+        raise ValueError("Constraint variable not within required values: {'budget', 'team', 'all', 'none'}")
+
+    get_best_squads([constraint], rows_to_check, method, path=path)
@@ -1,24 +1,26 @@
 import sqlite3
+import os
+import pickle
 import pandas as pd
 import PYTHON.data_cleaning_functions as dcf
 
 
-def current_season_cleaner():
-
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
-
-    db_connection = sqlite3.connect(path + 'seasons.sqlite')
-
-    gameweeks_df = pd.read_csv(path + 'CSV/raw_gameweek_data/gameweeks-2020-21.csv')
-    odds_df = pd.read_csv(path + 'CSV/bookies_odds/odds-2020-21.csv')
+def clean_gameweeks(gameweeks_df, odds_df, db_connection):
+    """
+    Cleans the current seasons gameweeks up to the features that only need each observation's own match.
 
+    :param gameweeks_df: The raw current season gameweeks dataframe.
+    :param odds_df: The current season odds dataframe.
+    :param db_connection: The connection to the SQL database to persist the joined tables to, or None.
+    :return: The cleaned gameweeks dataframe.
+    """
     gameweeks_df = dcf.minutes_played(gameweeks_df)
 
     dcf.add_season('2020-21', gameweeks_df)
 
     gameweeks_df["plays_for"] = gameweeks_df["team"].replace({"Sheffield Utd": "Sheffield United", "Spurs": "Tottenham",
                                                               "Man Utd": "Man United"})
-    
+
     dcf.adjust_points(gameweeks_df)
 
     dcf.clean_team_names(gameweeks_df, odds_df)
@@ -35,8 +37,97 @@ def current_season_cleaner():
 
     dcf.won_the_game(gameweeks_df)
 
+    return gameweeks_df
+
+
+def current_season_cleaner(persist=False, incremental=False, path=None):
+    """
+    Cleans the current seasons gameweeks and saves them with the other clean seasons.
+
+    In incremental mode only the fixtures that were not cleaned in the last run are cleaned. Their rolling means use
+    each players last appearances from the saved clean season, and the shifted match information of each players
+    previous last appearance is filled in from their new appearance. A full clean is done instead if there is no
+    checkpoint from a previous run or a new fixture was played before one that was already cleaned.
+
+    :param persist: Whether to persist the joined tables to the seasons SQL database for debugging. Default is False,
+                    which does every join in memory without touching the database.
+    :param incremental: Whether to only clean the fixtures that were not cleaned in the last run. Default is False.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: Dataframe of the clean observations that were added or changed in an incremental run, to be passed on to
+             season_concatenator, or None if the whole season was cleaned.
+    """
+
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+
+    db_connection = sqlite3.connect(path + 'seasons.sqlite') if persist else None
+
+    checkpoint_path = path + 'CSV/checkpoints/current_season.pkl'
+    clean_path = path + 'CSV/clean_season_data/clean-2020-21.csv'
+
+    gameweeks_df = pd.read_csv(path + 'CSV/raw_gameweek_data/gameweeks-2020-21.csv')
+    odds_df = pd.read_csv(path + 'CSV/bookies_odds/odds-2020-21.csv')
+
+    os.makedirs(path + 'CSV/checkpoints', exist_ok=True)
+    checkpoint = {'fixtures': set(gameweeks_df['fixture'])}
+
+    if incremental and os.path.exists(checkpoint_path) and os.path.exists(clean_path):
+        with open(checkpoint_path, 'rb') as file:
+            cleaned_fixtures = pickle.load(file)['fixtures']
+        changes = incremental_clean(gameweeks_df[~gameweeks_df['fixture'].isin(cleaned_fixtures)], odds_df,
+                                    pd.read_csv(clean_path), clean_path, db_connection)
+        if changes is not None:
+            with open(checkpoint_path, 'wb') as file:
+                pickle.dump(checkpoint, file)
+            return changes
+
+    gameweeks_df = clean_gameweeks(gameweeks_df, odds_df, db_connection)
+
+    dcf.mean_statistics(gameweeks_df)
+
+    dcf.shift_match_info(gameweeks_df)
+
+    dcf.useful_columns(gameweeks_df).to_csv(clean_path, index=False)
+
+    with open(checkpoint_path, 'wb') as file:
+        pickle.dump(checkpoint, file)
+
+
+def incremental_clean(new_gameweeks_df, odds_df, clean_df, clean_path, db_connection):
+    """
+    Cleans the new fixtures of the current season onto the saved clean season.
+
+    :param new_gameweeks_df: The raw gameweeks observations of the fixtures that have not been cleaned yet.
+    :param odds_df: The current season odds dataframe.
+    :param clean_df: The saved clean season dataframe.
+    :param clean_path: The path of the clean season CSV to save the updated clean season to.
+    :param db_connection: The connection to the SQL database to persist the joined tables to, or None.
+    :return: Dataframe of the clean observations that were added or changed, or None if a full clean is needed.
+    """
+    new_gameweeks_df = clean_gameweeks(new_gameweeks_df, odds_df, db_connection)
+    if new_gameweeks_df.empty:
+        return clean_df.iloc[:0]
+    new_gameweeks_df['date_of_match'] = new_gameweeks_df['date_of_match'].astype(str)
+    new_gameweeks_df.index = range(len(clean_df), len(clean_df) + len(new_gameweeks_df))
+
+    # the last 3 appearances of each player with a new appearance, enough for their rolling means and shifts
+    previous = clean_df[clean_df['name'].isin(new_gameweeks_df['name'])].sort_values(
+        by=['name', 'date_of_match'], ascending=[True, False], kind='mergesort').groupby('name').head(3)
+    last_appearances = previous.groupby('name')['date_of_match'].max()
+    if (new_gameweeks_df['date_of_match'] < new_gameweeks_df['name'].map(last_appearances)).any():
+        return None
+
+    gameweeks_df = pd.concat([previous, new_gameweeks_df])
+
     dcf.mean_statistics(gameweeks_df)
 
     dcf.shift_match_info(gameweeks_df)
 
-    dcf.useful_columns(gameweeks_df).to_csv(path + 'CSV/clean_season_data/clean-2020-21.csv', index=False)
+    last_index = previous.drop_duplicates(subset=['name']).index
+    shift_columns = [column for column in clean_df.columns if column.startswith('shift_')]
+    clean_df.loc[last_index, shift_columns] = gameweeks_df.loc[last_index, shift_columns]
+
+    new_clean_df = dcf.useful_columns(gameweeks_df.loc[new_gameweeks_df.index]).sort_values(
+        by='date_of_match', ascending=False)
+    pd.concat([new_clean_df, clean_df]).to_csv(clean_path, index=False)
+
+    return pd.concat([new_clean_df, clean_df.loc[last_index]])
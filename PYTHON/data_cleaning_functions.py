@@ -1,7 +1,18 @@
-from pandas.io import sql
 import pandas as pd
+import numpy as np
 from datetime import timedelta
 
+# statistics the rolling means are taken for, and the name each mean column is given
+rolling_statistics = {'adjusted_points': 'points', 'creativity': 'creativity', 'threat': 'threat',
+                      'influence': 'influence', 'bps': 'bps', 'goals_scored': 'goals', 'assists': 'assists',
+                      'goals_conceded': 'conceded'}
+
+# match information shifted onto the players previous appearance, and the name each shifted column is given
+shifted_columns = {'adjusted_points': 'shift_points', 'opponent_team': 'shift_opponent',
+                   'win_expectation': 'shift_win_expectation', 'month_of_match': 'shift_month_of_match',
+                   'time_of_match': 'shift_time_of_match', 'was_home': 'shift_was_home',
+                   **{'mean_' + mean: 'shift_mean_' + mean for mean in rolling_statistics.values()}}
+
 
 def minutes_played(dataframe):
     """
@@ -56,7 +67,26 @@ def to_sql(dataframe, season, connection, dataframe_type):
                      if_exists='replace', index=False)
 
 
-def position_joiner_and_cleaner(gameweeks_dataframe, positions_dataframe, season, connection):
+def left_join(left_dataframe, right_dataframe, left_on, right_on):
+    """
+    Joins two dataframes in memory with the same result as an SQL LEFT JOIN. Every row of the left dataframe is kept
+    in order, repeated for each matching row of the right dataframe, and null keys never match. Boolean columns are
+    stored as 0/1, the same as in the SQL database, so the cleaned CSVs are unchanged.
+
+    :param left_dataframe: The dataframe to keep every row of.
+    :param right_dataframe: The dataframe to join on.
+    :param left_on: Column or list of columns in the left dataframe to join on.
+    :param right_on: Column or list of columns in the right dataframe to join on.
+    :return: The joined dataframe.
+    """
+    right_dataframe = right_dataframe.dropna(subset=[right_on] if isinstance(right_on, str) else right_on)
+    dataframe = left_dataframe.merge(right_dataframe, how='left', left_on=left_on, right_on=right_on)
+    booleans = dataframe.select_dtypes(include='bool').columns
+    dataframe[booleans] = dataframe[booleans].astype(int)
+    return dataframe
+
+
+def position_joiner_and_cleaner(gameweeks_dataframe, positions_dataframe, season, connection=None):
     """
     Joins the positions of every player from the positions dataframes onto the gameweeks dataframes.
 
@@ -64,19 +94,16 @@ def position_joiner_and_cleaner(gameweeks_dataframe, positions_dataframe, season
     :param positions_dataframe: The corresponding positions dataframe.
     :param season: {'2016-17', '2017-18', '2018-19', '2019-20'}
                    The specified season that you will be joining the positions on.
-    :param connection: The connection to the SQL database.
+    :param connection: The connection to the SQL database to persist the tables to for debugging. Default is None, the
+                       join is always done in memory.
     :return: The gameweeks dataframe with cleaned positions appended to each observation.
     """
-    to_sql(gameweeks_dataframe, season, connection, 'gameweeks')
-    to_sql(positions_dataframe, season, connection, 'positions')
+    if connection is not None:
+        to_sql(gameweeks_dataframe, season, connection, 'gameweeks')
+        to_sql(positions_dataframe, season, connection, 'positions')
 
-    sql_string = '''
-                 SELECT a.*, b.element_type
-                 FROM gameweeks_{season} a
-                 LEFT JOIN positions_{season} b
-                 ON a.name = b.player_name
-                 '''
-    dataframe = sql.read_sql(sql_string.format(season=season), con=connection)
+    dataframe = left_join(gameweeks_dataframe, positions_dataframe[['player_name', 'element_type']], 'name',
+                          'player_name').drop('player_name', axis=1)
     dataframe['element_type'] = dataframe['element_type'].replace({1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'})
     dataframe.rename(columns={'element_type': 'position'}, inplace=True)
     return dataframe
@@ -93,22 +120,36 @@ def clean_team_names(gameweeks_dataframe, odds_dataframe):
         {key + 1: value for key, value in enumerate(sorted(odds_dataframe['HomeTeam'].unique()))})
 
 
+def fixture_teams(dataframe):
+    """
+    Gets the two teams in each fixture from the opponents of the players that played in it. A fixture where only one
+    team's players played can't be resolved, so it raises rather than making the team play itself.
+
+    :param dataframe: The gameweeks dataframe.
+    :return: Dataframe indexed by fixture with a 'first' and 'last' column of the two teams.
+    """
+    teams = dataframe[['fixture', 'opponent_team']].drop_duplicates().groupby('fixture')['opponent_team'].agg(
+        ['first', 'last', 'count'])
+    unresolved = teams.index[teams['count'] != 2]
+    if len(unresolved):
+        raise ValueError('Fixtures {} do not have players from exactly two teams, so their home and away teams are '
+                         'unknown.'.format(list(unresolved)))
+    return teams[['first', 'last']]
+
+
 def home_and_away_teams(dataframe):
     """
     Gets the home and away teams for each gameweeks observation.
 
     :param dataframe: The gameweeks dataframe.
     """
-    fixture_ids = {}
-    for i in range(1, max(dataframe['fixture'] + 1)):
-        fixture_ids[i] = set(dataframe[dataframe['fixture'] == i]['opponent_team'])
+    teams = fixture_teams(dataframe).reindex(dataframe['fixture'])
+    opponent = dataframe['opponent_team'].to_numpy()
+    plays_for = np.where(teams['first'].to_numpy() == opponent, teams['last'].to_numpy(), teams['first'].to_numpy())
+    was_home = dataframe['was_home'].astype(bool).to_numpy()
 
-    dataframe['home_team'] = [[team for team in fixture_ids[fixture] if team != opponent][0] if is_home else opponent
-                              for is_home, opponent, fixture in
-                              zip(dataframe['was_home'], dataframe['opponent_team'], dataframe['fixture'])]
-    dataframe['away_team'] = [opponent if is_home else [team for team in fixture_ids[fixture] if team != opponent][0]
-                              for is_home, opponent, fixture in
-                              zip(dataframe['was_home'], dataframe['opponent_team'], dataframe['fixture'])]
+    dataframe['home_team'] = np.where(was_home, plays_for, opponent)
+    dataframe['away_team'] = np.where(was_home, opponent, plays_for)
 
 
 def played_for(dataframe):
@@ -117,11 +158,11 @@ def played_for(dataframe):
 
     :param dataframe: The gameweeks dataframe.
     """
-    dataframe['plays_for'] = [home if is_home else away for is_home, home, away in
-                              zip(dataframe['was_home'], dataframe['home_team'], dataframe['away_team'])]
+    dataframe['plays_for'] = np.where(dataframe['was_home'].astype(bool), dataframe['home_team'],
+                                      dataframe['away_team'])
 
 
-def odds_joiner(gameweeks_dataframe, odds_dataframe, season, connection):
+def odds_joiner(gameweeks_dataframe, odds_dataframe, season, connection=None):
     """
     Joins the odds of each fixture onto each player observation in the gameweeks dataframe.
 
@@ -129,19 +170,15 @@ def odds_joiner(gameweeks_dataframe, odds_dataframe, season, connection):
     :param odds_dataframe: The corresponding odds dataframe.
     :param season: {'2016-17', '2017-18', '2018-19', '2019-20'}
                    The specified season that you will be joining the positions on.
-    :param connection: The connection to the SQL database.
+    :param connection: The connection to the SQL database to persist the tables to for debugging. Default is None, the
+                       join is always done in memory.
     :return: The gameweeks dataframe with the bookies odds appended to each observation.
     """
-    to_sql(gameweeks_dataframe, season, connection, 'gameweeks')
-    to_sql(odds_dataframe, season, connection, 'odds')
+    if connection is not None:
+        to_sql(gameweeks_dataframe, season, connection, 'gameweeks')
+        to_sql(odds_dataframe, season, connection, 'odds')
 
-    sql_string = '''
-                 SELECT *
-                 FROM gameweeks_{season} a
-                 LEFT JOIN odds_{season} b
-                 ON a.home_team = b.HomeTeam AND a.away_team = b.AwayTeam
-                 '''
-    return sql.read_sql(sql_string.format(season=season), con=connection)
+    return left_join(gameweeks_dataframe, odds_dataframe, ['home_team', 'away_team'], ['HomeTeam', 'AwayTeam'])
 
 
 def dates_cleaner(dataframe):
@@ -198,39 +235,28 @@ def won_the_game(dataframe):
 
 def mean_statistics(dataframe):
     """
-    Gets the rolling mean of the players statistics from their previous 3 appearances.
+    Gets the rolling mean of the players statistics from their previous 3 appearances. Each mean is the sum of the
+    appearances from the most recent back divided by how many there are, the same sum as Series.mean, so the means
+    are exactly the same floats as taking the mean of each players last 3 rows.
 
     :param dataframe: A gameweeks dataframe.
     """
     dataframe.sort_values(by='date_of_match', ascending=False, inplace=True)
-    mean_points, mean_creativity, mean_threat, mean_influence, mean_bps, mean_goals, mean_assists, mean_conceded \
-        = ([] for _ in range(8))
-    for player, date in zip(dataframe['name'], dataframe['date_of_match']):
-        players_df = dataframe[(dataframe['name'] == player) & (dataframe['date_of_match'] < date)][:3]
-        mean_points.append(players_df['adjusted_points'].mean())
-        mean_creativity.append(players_df['creativity'].mean())
-        mean_threat.append(players_df['threat'].mean())
-        mean_influence.append(players_df['influence'].mean())
-        mean_bps.append(players_df['bps'].mean())
-        mean_goals.append(players_df['goals_scored'].mean())
-        mean_assists.append(players_df['assists'].mean())
-        mean_conceded.append(players_df['goals_conceded'].mean())
-    dataframe['mean_points'] = mean_points
-    dataframe['mean_creativity'] = mean_creativity
-    dataframe['mean_threat'] = mean_threat
-    dataframe['mean_influence'] = mean_influence
-    dataframe['mean_bps'] = mean_bps
-    dataframe['mean_goals'] = mean_goals
-    dataframe['mean_assists'] = mean_assists
-    dataframe['mean_conceded'] = mean_conceded
-    dataframe['mean_points'].fillna(dataframe['adjusted_points'], inplace=True)
-    dataframe['mean_creativity'].fillna(dataframe['creativity'], inplace=True)
-    dataframe['mean_threat'].fillna(dataframe['threat'], inplace=True)
-    dataframe['mean_influence'].fillna(dataframe['influence'], inplace=True)
-    dataframe['mean_bps'].fillna(dataframe['bps'], inplace=True)
-    dataframe['mean_goals'].fillna(dataframe['goals_scored'], inplace=True)
-    dataframe['mean_assists'].fillna(dataframe['assists'], inplace=True)
-    dataframe['mean_conceded'].fillna(dataframe['goals_conceded'], inplace=True)
+    appearances = dataframe[['name', 'date_of_match'] + list(rolling_statistics)].sort_values(
+        by=['name', 'date_of_match'], kind='mergesort')
+    grouped = appearances.groupby('name', sort=False)[list(rolling_statistics)]
+    totals, counts = 0, 0
+    for appearances_back in range(1, 4):
+        previous = grouped.shift(appearances_back).astype(float)
+        totals = totals + previous.fillna(0)
+        counts = counts + previous.notna()
+    means = totals / counts.where(counts > 0)
+    # a players appearances on the same date only use the appearances from before that date
+    first_on_date = ~appearances.duplicated(subset=['name', 'date_of_match'])
+    means = means.where(first_on_date).groupby([appearances['name'], appearances['date_of_match']]).ffill()
+    for statistic, mean in rolling_statistics.items():
+        dataframe['mean_' + mean] = means[statistic]
+        dataframe['mean_' + mean] = dataframe['mean_' + mean].fillna(dataframe[statistic])
 
 
 def shift_match_info(dataframe):
@@ -240,39 +266,10 @@ def shift_match_info(dataframe):
 
     :param dataframe: A gameweeks dataframe.
     """
-    shift_points, shift_opponent, shift_we, shift_mom, shift_tom, shift_home, shift_mean_points, \
-    shift_mean_creativity, shift_mean_threat, shift_mean_influence, shift_mean_bps, shift_mean_goals, \
-    shift_mean_assists, shift_mean_conceded = ([] for _ in range(14))
-    for player in dataframe['name'].unique():
-        players_df = dataframe[dataframe['name'] == player].sort_values(by='date_of_match', ascending=False)
-        shift_points.append(players_df['adjusted_points'].shift())
-        shift_opponent.append(players_df['opponent_team'].shift())
-        shift_we.append(players_df['win_expectation'].shift())
-        shift_mom.append(players_df['month_of_match'].shift())
-        shift_tom.append(players_df['time_of_match'].shift())
-        shift_home.append(players_df['was_home'].shift())
-        shift_mean_points.append(players_df['mean_points'].shift())
-        shift_mean_creativity.append(players_df['mean_creativity'].shift())
-        shift_mean_threat.append(players_df['mean_threat'].shift())
-        shift_mean_influence.append(players_df['mean_influence'].shift())
-        shift_mean_bps.append(players_df['mean_bps'].shift())
-        shift_mean_goals.append(players_df['mean_goals'].shift())
-        shift_mean_assists.append(players_df['mean_assists'].shift())
-        shift_mean_conceded.append(players_df['mean_conceded'].shift())
-    dataframe['shift_points'] = pd.concat(shift_points).sort_index()
-    dataframe['shift_opponent'] = pd.concat(shift_opponent).sort_index()
-    dataframe['shift_win_expectation'] = pd.concat(shift_we).sort_index()
-    dataframe['shift_month_of_match'] = pd.concat(shift_mom).sort_index()
-    dataframe['shift_time_of_match'] = pd.concat(shift_tom).sort_index()
-    dataframe['shift_was_home'] = pd.concat(shift_home).sort_index()
-    dataframe['shift_mean_points'] = pd.concat(shift_mean_points).sort_index()
-    dataframe['shift_mean_creativity'] = pd.concat(shift_mean_creativity).sort_index()
-    dataframe['shift_mean_threat'] = pd.concat(shift_mean_threat).sort_index()
-    dataframe['shift_mean_influence'] = pd.concat(shift_mean_influence).sort_index()
-    dataframe['shift_mean_bps'] = pd.concat(shift_mean_bps).sort_index()
-    dataframe['shift_mean_goals'] = pd.concat(shift_mean_goals).sort_index()
-    dataframe['shift_mean_assists'] = pd.concat(shift_mean_assists).sort_index()
-    dataframe['shift_mean_conceded'] = pd.concat(shift_mean_conceded).sort_index()
+    matches = dataframe.sort_values(by=['name', 'date_of_match'], ascending=[True, False], kind='mergesort')
+    shifted = matches.groupby('name', sort=False)[list(shifted_columns)].shift()
+    for column, shift_column in shifted_columns.items():
+        dataframe[shift_column] = shifted[column]
 
 
 def useful_columns(dataframe):
@@ -296,30 +293,37 @@ def useful_columns(dataframe):
         return dataframe[columns]
 
 
-def attacking_or_defending(dataframe, connection):
+def defender_types(dataframe):
+    """
+    Gets whether each defender is an attacking (full back) or defending (centre back) defender depending on the players
+    median creativity.
+
+    :param dataframe: The concatenated gameweeks dataframe.
+    :return: Series of {'AttDEF', 'DefDEF'} indexed by the defenders names.
+    """
+    creativity = dataframe[(dataframe['position'] == 'DEF')].groupby(['name'])['creativity'].median()
+    return pd.Series(['AttDEF' if creativity > 2 else 'DefDEF' for creativity in creativity], index=creativity.index,
+                     name='type_of_def', dtype=object)
+
+
+def attacking_or_defending(dataframe, connection=None):
     """
     Splits the defenders into attacking (full backs) or defending (centre backs) defenders depending on the players
     median creativity in the season. Can only be done on the concatenated gameweeks dataframe otherwise large number
     of errors in positions.
 
     :param dataframe: The concatenated gameweeks dataframe.
-    :param connection: The connection to the SQL database.
+    :param connection: The connection to the SQL database to persist the tables to for debugging. Default is None, the
+                       join is always done in memory.
     :return:
     """
-    defenders = dataframe[(dataframe['position'] == 'DEF')].groupby(['name']).median().reset_index()
-    defenders['type_of_def'] = ['AttDEF' if creativity > 2 else 'DefDEF' for creativity in defenders['creativity']]
-
-    to_sql(defenders, 'all', connection, 'defenders')
-    to_sql(dataframe, 'all', connection, 'gameweeks')
+    defenders = defender_types(dataframe).reset_index()
 
-    sql_string = '''
-                 SELECT a.*, b.type_of_def
-                 FROM gameweeks_all a
-                 LEFT JOIN defenders_all b
-                 ON a.name = b.name
-                 '''
+    if connection is not None:
+        to_sql(defenders, 'all', connection, 'defenders')
+        to_sql(dataframe, 'all', connection, 'gameweeks')
 
-    dataframe = sql.read_sql(sql_string, con=connection)
+    dataframe = left_join(dataframe, defenders, 'name', 'name')
 
     dataframe['position'] = [defpos if position == 'DEF' else position for position, defpos in
                              zip(dataframe['position'], dataframe['type_of_def'])]
@@ -328,67 +332,101 @@ def attacking_or_defending(dataframe, connection):
     return dataframe
 
 
-def form_against_next_opponent(fixtures_dataframe, gameweeks_dataframe):
+def head_to_head_index(gameweeks_dataframe):
+    """
+    Gets the sum and count of each players statistics against each opponent, so the mean statistics against an
+    opponent can be looked up without searching the gameweeks.
+
+    :param gameweeks_dataframe: The dataframe with the players statistics.
+    :return: Dataframe indexed by (name, opponent_team) with a (statistic, 'sum') and (statistic, 'count') column for
+             each statistic.
+    """
+    return gameweeks_dataframe.groupby(['name', 'opponent_team'])[list(rolling_statistics)].agg(['sum', 'count'])
+
+
+def update_head_to_head_index(head_to_head, new_gameweeks_dataframe):
+    """
+    Adds the statistics from newly played gameweeks onto a head to head index.
+
+    :param head_to_head: The head to head index from head_to_head_index.
+    :param new_gameweeks_dataframe: The dataframe of the new gameweeks observations.
+    :return: The updated head to head index.
+    """
+    return head_to_head.add(head_to_head_index(new_gameweeks_dataframe), fill_value=0)
+
+
+def form_against_next_opponent(fixtures_dataframe, gameweeks_dataframe=None, head_to_head=None):
     """
     Gets the mean statistics for a player against the specified shifted opponent.
 
     :param fixtures_dataframe: The dataframe you want to add the form to.
-    :param gameweeks_dataframe: The dataframe with the players names you want to sort through.
-    """
-    points_ano, creativity_ano, threat_ano, influence_ano, bps_ano, goals_ano, assists_ano, conceded_ano = \
-        ([] for _ in range(8))
-    for player, opponent in zip(fixtures_dataframe['name'], fixtures_dataframe['shift_opponent']):
-        players_df = gameweeks_dataframe[(gameweeks_dataframe['name'] == player) & (gameweeks_dataframe['opponent_team']
-                                                                                    == opponent)]
-        points_ano.append(players_df['adjusted_points'].mean())
-        creativity_ano.append(players_df['creativity'].mean())
-        threat_ano.append(players_df['threat'].mean())
-        influence_ano.append(players_df['influence'].mean())
-        bps_ano.append(players_df['bps'].mean())
-        goals_ano.append(players_df['goals_scored'].mean())
-        assists_ano.append(players_df['assists'].mean())
-        conceded_ano.append(players_df['goals_conceded'].mean())
-    fixtures_dataframe['points_against_shift_opponent'] = points_ano
-    fixtures_dataframe['creativity_against_shift_opponent'] = creativity_ano
-    fixtures_dataframe['threat_against_shift_opponent'] = threat_ano
-    fixtures_dataframe['influence_against_shift_opponent'] = influence_ano
-    fixtures_dataframe['bps_against_shift_opponent'] = bps_ano
-    fixtures_dataframe['goals_against_shift_opponent'] = goals_ano
-    fixtures_dataframe['assists_against_shift_opponent'] = assists_ano
-    fixtures_dataframe['conceded_against_shift_opponent'] = conceded_ano
-
-
-def shifted_points_range(dataframe):
+    :param gameweeks_dataframe: The dataframe with the players names you want to sort through. Not needed if the
+                                head_to_head index is given.
+    :param head_to_head: A head to head index of the gameweeks from head_to_head_index. Default is None, which builds
+                         the index from the gameweeks_dataframe.
+    """
+    if head_to_head is None:
+        head_to_head = head_to_head_index(gameweeks_dataframe)
+    matched = head_to_head.reindex(pd.MultiIndex.from_arrays([fixtures_dataframe['name'],
+                                                              fixtures_dataframe['shift_opponent']]))
+    for statistic, mean in rolling_statistics.items():
+        fixtures_dataframe[mean + '_against_shift_opponent'] = \
+            (matched[(statistic, 'sum')] / matched[(statistic, 'count')]).to_numpy()
+
+
+def shifted_points_range(dataframe, bounds=None):
     """
     Turns the shifted points into a categorical value.
 
     :param dataframe: The concatenated gameweeks dataframe.
+    :param bounds: The (lowest, highest) shifted points to use as the outer edges of the ranges. Default is None, which
+                   uses the lowest and highest shifted points in the dataframe.
+    :return: The (lowest, highest) shifted points used as the outer edges of the ranges.
     """
     shift_points = dataframe['shift_points']
-    dataframe['shift_points_range'] = pd.cut(shift_points,
-                                             [min(shift_points.dropna()), 0, 4, 10, max(shift_points.dropna())],
-                                             labels=[0, 1, 2, 3])
+    if bounds is None:
+        bounds = (min(shift_points.dropna()), max(shift_points.dropna()))
+    dataframe['shift_points_range'] = pd.cut(shift_points, [bounds[0], 0, 4, 10, bounds[1]], labels=[0, 1, 2, 3])
     dataframe.drop('shift_points', axis=1, inplace=True)
+    return bounds
 
 
-def next_odds_joiner(fixtures_dataframe, odds_dataframe, connection):
+def match_keys(dataframe):
     """
-    Joins the odds of each upcoming fixture onto each player observation in the gameweeks dataframe.
+    Gets a key for each observation that identifies the match it came from, so the same observation can be found again
+    in a later run.
+
+    :param dataframe: A gameweeks dataframe.
+    :return: MultiIndex of (season, name, date_of_match, opponent_team).
+    """
+    return pd.MultiIndex.from_arrays([dataframe['season'], dataframe['name'], dataframe['date_of_match'].astype(str),
+                                      dataframe['opponent_team']])
+
+
+def next_odds_joiner(fixtures_dataframe, odds_dataframe, connection=None):
+    """
+    Joins the odds of each upcoming fixture onto each player observation in the gameweeks dataframe. A player is
+    joined onto every fixture their team plays in, either at home or away.
 
     :param fixtures_dataframe: The dataframe of the upcoming fixtures.
     :param odds_dataframe: The dataframe with the next odds in it.
-    :param connection: The connection to the SQL database.
+    :param connection: The connection to the SQL database to persist the tables to for debugging. Default is None, the
+                       join is always done in memory.
     :return: The next_fixtures dataframe with the next odds appended to it.
     """
-    to_sql(fixtures_dataframe, 'fixtures', connection, 'next')
-    to_sql(odds_dataframe, 'odds', connection, 'next')
-    sql_string = '''
-                 SELECT *
-                 FROM next_fixtures a
-                 LEFT JOIN next_odds b
-                 ON a.plays_for = b.shift_home_team OR a.plays_for = b.shift_away_team
-                 '''
-    return sql.read_sql(sql_string, con=connection)
+    if connection is not None:
+        to_sql(fixtures_dataframe, 'fixtures', connection, 'next')
+        to_sql(odds_dataframe, 'odds', connection, 'next')
+
+    odds_dataframe = odds_dataframe.reset_index(drop=True)
+    teams = pd.concat([odds_dataframe['shift_home_team'], odds_dataframe['shift_away_team']]).rename('team')
+    teams = teams.rename_axis('odds_row').reset_index().drop_duplicates()
+
+    dataframe = left_join(fixtures_dataframe.reset_index(drop=True).rename_axis('fixture_row').reset_index(), teams,
+                          'plays_for', 'team')
+    dataframe = dataframe.sort_values(by=['fixture_row', 'odds_row'], kind='mergesort')
+    dataframe = left_join(dataframe, odds_dataframe.rename_axis('odds_row').reset_index(), 'odds_row', 'odds_row')
+    return dataframe.drop(['fixture_row', 'odds_row', 'team'], axis=1).reset_index(drop=True)
 
 
 def shifted_was_home(dataframe):
@@ -412,33 +450,33 @@ def shifted_opponent(dataframe):
                                        dataframe['shift_away_team'])]
 
 
-def shift_match_stats_for_next_fixtures(fixtures_dataframe, gameweeks_dataframe):
+def recent_form(gameweeks_dataframe, appearances=3):
     """
-    Get the mean match stats for the final played gameweek.
+    Gets the mean statistics of every player from their most recent appearances.
 
-    :param fixtures_dataframe: The fixtures dataframe.
     :param gameweeks_dataframe: The gameweeks dataframe.
+    :param appearances: The number of most recent appearances to take the mean of.
+    :return: Dataframe indexed by the players names with a column for the mean of each statistic.
     """
-    mean_points, mean_creativity, mean_threat, mean_influence, mean_bps, mean_goals, mean_assists, mean_conceded = ([] for _ in range(8))
-    for player in fixtures_dataframe['name']:
-        players_df = gameweeks_dataframe[(gameweeks_dataframe['name'] == player)].sort_values(by='date_of_match',
-                                                                                              ascending=False)[:3]
-        mean_points.append(players_df['adjusted_points'].mean())
-        mean_creativity.append(players_df['creativity'].mean())
-        mean_threat.append(players_df['threat'].mean())
-        mean_influence.append(players_df['influence'].mean())
-        mean_bps.append(players_df['bps'].mean())
-        mean_goals.append(players_df['goals_scored'].mean())
-        mean_assists.append(players_df['assists'].mean())
-        mean_conceded.append(players_df['goals_conceded'].mean())
-    fixtures_dataframe['shift_mean_points'] = mean_points
-    fixtures_dataframe['shift_mean_creativity'] = mean_creativity
-    fixtures_dataframe['shift_mean_threat'] = mean_threat
-    fixtures_dataframe['shift_mean_influence'] = mean_influence
-    fixtures_dataframe['shift_mean_bps'] = mean_bps
-    fixtures_dataframe['shift_mean_goals'] = mean_goals
-    fixtures_dataframe['shift_mean_assists'] = mean_assists
-    fixtures_dataframe['shift_mean_conceded'] = mean_conceded
+    recent = gameweeks_dataframe.sort_values(by=['name', 'date_of_match'], ascending=[True, False],
+                                             kind='mergesort').groupby('name', sort=False).head(appearances)
+    return recent.groupby('name')[list(rolling_statistics)].mean()
+
+
+def shift_match_stats_for_next_fixtures(fixtures_dataframe, gameweeks_dataframe=None, form=None):
+    """
+    Get the mean match stats for the final played gameweek.
+
+    :param fixtures_dataframe: The fixtures dataframe.
+    :param gameweeks_dataframe: The gameweeks dataframe. Not needed if the form is given.
+    :param form: The players recent form from recent_form. Default is None, which gets the form from the last 3
+                 appearances in the gameweeks_dataframe.
+    """
+    if form is None:
+        form = recent_form(gameweeks_dataframe)
+    matched = form.reindex(fixtures_dataframe['name'])
+    for statistic, mean in rolling_statistics.items():
+        fixtures_dataframe['shift_mean_' + mean] = matched[statistic].to_numpy()
 
 
 def fill_null_shift_opponent(dataframe):
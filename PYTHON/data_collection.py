@@ -1,14 +1,143 @@
+import os
+import json
+import hashlib
 import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 
+# the file each source is saved to, relative to the CSV directory, and the url it is downloaded from
+data_sources = {
+    # the latest merged CSV file from the Github recourse for the players 2020-21 FPL data
+    'raw_gameweek_data/gameweeks-2020-21.csv':
+        'https://github.com/vaastav/Fantasy-Premier-League/raw/master/data/2020-21/gws/merged_gw.csv',
+    # the latest CSV file with the bookies odds for the 2020-21 season
+    'bookies_odds/odds-2020-21.csv': 'https://www.football-data.co.uk/mmz4281/2021/E0.csv'
+}
 
-def get_data():
 
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/CSV/'
+def load_metadata(metadata_path):
+    """
+    Loads the ETag, Last-Modified and content hash saved for each downloaded file.
 
-    # Downloads the latest merged CSV file from the Github recourse for the players 2020-21 FPL data.
-    fpl_data_url = 'https://github.com/vaastav/Fantasy-Premier-League/raw/master/data/2020-21/gws/merged_gw.csv'
-    urllib.request.urlretrieve(fpl_data_url, path + 'raw_gameweek_data/gameweeks-2020-21.csv')
+    :param metadata_path: The path to the JSON metadata file.
+    :return: Dictionary of the relative file path to its metadata, which is empty if nothing has been downloaded yet.
+    """
+    if not os.path.exists(metadata_path):
+        return {}
+    with open(metadata_path) as file:
+        return json.load(file)
 
-    # Downloads the latest CSV file with the bookies odds for the 2020-21 season.
-    bookies_odds_url = 'https://www.football-data.co.uk/mmz4281/2021/E0.csv'
-    urllib.request.urlretrieve(bookies_odds_url, path + 'bookies_odds/odds-2020-21.csv')
+
+def save_metadata(metadata, metadata_path):
+    """
+    Saves the metadata of each downloaded file, writing to a temporary file first and then moving it into place.
+
+    :param metadata: Dictionary of the relative file path to its metadata.
+    :param metadata_path: The path to the JSON metadata file.
+    """
+    with open(metadata_path + '.tmp', 'w') as file:
+        json.dump(metadata, file, indent=4)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+
+def file_hash(file_path):
+    """
+    Gets the sha256 hash of a files contents.
+
+    :param file_path: The path to the file.
+    :return: The hex digest, or None if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch(url, file_path, metadata, timeout=60):
+    """
+    Downloads a url to a file if it has changed since the last download. The request sends the saved ETag and
+    Last-Modified back so an unchanged file is answered with 304 Not Modified, and a file that is downloaded again with
+    the same contents is not rewritten. A new file is written to a temporary file and then moved into place, so the
+    file is never left half written.
+
+    :param url: The url to download.
+    :param file_path: The path to save the file to.
+    :param metadata: The metadata saved at the last download of the file, or an empty dictionary.
+    :param timeout: The number of seconds to wait for the server.
+    :return: The new metadata of the file, with the 'url', 'etag', 'last_modified', 'sha256' of the contents and
+             whether it 'changed'.
+    """
+    request = urllib.request.Request(url)
+    if os.path.exists(file_path) and metadata.get('url') == url:
+        if metadata.get('etag'):
+            request.add_header('If-None-Match', metadata['etag'])
+        if metadata.get('last_modified'):
+            request.add_header('If-Modified-Since', metadata['last_modified'])
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return {**metadata, 'changed': False}
+        raise
+
+    digest = hashlib.sha256()
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        with response, open(file_path + '.tmp', 'wb') as file:
+            for chunk in iter(lambda: response.read(1 << 20), b''):
+                digest.update(chunk)
+                file.write(chunk)
+    except Exception:
+        os.remove(file_path + '.tmp')
+        raise
+
+    sha256 = digest.hexdigest()
+    changed = sha256 != file_hash(file_path)
+    if changed:
+        os.replace(file_path + '.tmp', file_path)
+    else:
+        os.remove(file_path + '.tmp')
+    return {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+            'sha256': sha256, 'changed': changed}
+
+
+def get_data(sources=None, path=None, workers=4, timeout=60):
+    """
+    Downloads every data source at the same time, skipping the ones that have not changed since the last download.
+    The ETag, Last-Modified and sha256 of each file are saved in download_metadata.json, so later stages can tell if
+    their inputs changed.
+
+    :param sources: Dictionary of the file path, relative to the CSV directory, to the url to download it from. Default
+                    is None, which downloads the data_sources.
+    :param path: The CSV directory to save the files to. Default is None, which uses the projects CSV directory.
+    :param workers: The number of downloads to run at once.
+    :param timeout: The number of seconds to wait for each server.
+    :return: Dictionary of the relative file path to its metadata, including whether it 'changed'.
+    """
+    sources = sources or data_sources
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/CSV/'
+
+    metadata_path = path + 'download_metadata.json'
+    metadata = load_metadata(metadata_path)
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {file: executor.submit(fetch, url, path + file, metadata.get(file, {}), timeout)
+                   for file, url in sources.items()}
+
+    results, errors = {}, []
+    for file, future in futures.items():
+        try:
+            results[file] = future.result()
+        except Exception as error:
+            errors.append(error)
+    metadata.update({file: {key: value for key, value in result.items() if key != 'changed'}
+                     for file, result in results.items()})
+    save_metadata(metadata, metadata_path)
+
+    if errors:
+        raise errors[0]
+    return results
@@ -1,18 +1,29 @@
+import os
 import sqlite3
 import pandas as pd
-import data_cleaning_functions as dcf
+from concurrent.futures import ProcessPoolExecutor
+import PYTHON.data_cleaning_functions as dcf
 
-path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+finished_seasons = ['2016-17', '2017-18', '2018-19', '2019-20']
 
-db_connection = sqlite3.connect(path + 'seasons.sqlite')
+# set to True to persist the joined tables to the seasons SQL database for debugging
+persist = False
 
-for season in {'2016-17', '2017-18', '2018-19', '2019-20'}:
 
-    gameweeks_df = pd.read_csv(path + 'CSV/raw_gameweek_data/gameweeks-{}.csv'.format(season))
-    positions_df = pd.read_csv(path + 'CSV/raw_full_season_data/season-{}.csv'.format(season))
-    odds_df = pd.read_csv(path + 'CSV/bookies_odds/odds-{}.csv'.format(season))
+def clean_season(season, gameweeks_df, positions_df, odds_df, db_connection=None):
+    """
+    Cleans a finished season.
 
-    gameweeks_df = dcf.minutes_played(gameweeks_df)
+    :param season: The season, e.g. '2019-20'.
+    :param gameweeks_df: The raw gameweeks dataframe.
+    :param positions_df: The raw full season dataframe with each players position.
+    :param odds_df: The bookies odds dataframe.
+    :param db_connection: The connection to the SQL database to persist the joined tables to. Default is None, which
+                          does every join in memory.
+    :return: The clean season dataframe.
+    """
+    gameweeks_df = dcf.minutes_played(gameweeks_df).copy()
+    positions_df = positions_df.copy()
 
     dcf.add_season(season, gameweeks_df)
 
@@ -39,4 +50,60 @@ for season in {'2016-17', '2017-18', '2018-19', '2019-20'}:
 
     dcf.shift_match_info(gameweeks_df)
 
-    dcf.useful_columns(gameweeks_df).to_csv(path + 'CSV/clean_season_data/clean-{}.csv'.format(season), index=False)
+    return dcf.useful_columns(gameweeks_df)
+
+
+def clean_finished_season(season, persist=False, path=None):
+    """
+    Cleans a finished season from its raw CSVs and saves it with the other clean seasons.
+
+    :param season: The season, e.g. '2019-20'.
+    :param persist: Whether to persist the joined tables for debugging. Each season gets its own seasons-{season}.sqlite
+                    database, so seasons cleaned at the same time don't share a connection. Default is False, which
+                    does every join in memory without touching a database.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: The number of clean observations.
+    """
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+
+    db_connection = sqlite3.connect(path + 'seasons-{}.sqlite'.format(season)) if persist else None
+
+    gameweeks_df = pd.read_csv(path + 'CSV/raw_gameweek_data/gameweeks-{}.csv'.format(season))
+    positions_df = pd.read_csv(path + 'CSV/raw_full_season_data/season-{}.csv'.format(season))
+    odds_df = pd.read_csv(path + 'CSV/bookies_odds/odds-{}.csv'.format(season))
+
+    try:
+        clean_df = clean_season(season, gameweeks_df, positions_df, odds_df, db_connection)
+    finally:
+        if db_connection is not None:
+            db_connection.close()
+
+    clean_df.to_csv(path + 'CSV/clean_season_data/clean-{}.csv'.format(season), index=False)
+    return len(clean_df)
+
+
+def clean_finished_seasons(seasons=None, workers=None, persist=False, path=None):
+    """
+    Cleans finished seasons across a pool of processes, one season in each. The seasons don't depend on each other, so
+    cleaning more seasons takes about as long as the slowest season while there are cores free.
+
+    :param seasons: Iterable of the seasons to clean. Default is None, which cleans finished_seasons.
+    :param workers: The number of processes to run at once. Default is None, which uses every core. With 1 worker the
+                    seasons are cleaned one after another in this process.
+    :param persist: Whether to persist the joined tables of each season to its own SQL database for debugging.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: Dictionary of season: the number of clean observations.
+    """
+    seasons = list(seasons or finished_seasons)
+    workers = min(workers or os.cpu_count(), len(seasons))
+
+    if workers <= 1:
+        return {season: clean_finished_season(season, persist, path) for season in seasons}
+
+    with ProcessPoolExecutor(workers) as executor:
+        rows = executor.map(clean_finished_season, seasons, [persist] * len(seasons), [path] * len(seasons))
+        return dict(zip(seasons, rows))
+
+
+if __name__ == '__main__':
+    print(clean_finished_seasons(persist=persist))
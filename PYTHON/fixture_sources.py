@@ -0,0 +1,196 @@
+import os
+import io
+import json
+import time
+import hashlib
+import threading
+import urllib.request
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+fpl_api_url = 'https://fantasy.premierleague.com/api/'
+fixtures_odds_url = 'https://www.football-data.co.uk/fixtures.csv'
+sportradar_url = 'https://s5.sir.sportradar.com/bet365/en/1/season/77179/fixtures/round/21-{}'
+
+# the FPL API team names that differ from the team names in the gameweeks
+fpl_team_names = {'Sheffield Utd': 'Sheffield United', 'Spurs': 'Tottenham', 'Man Utd': 'Man United'}
+
+# the sportradar team names that differ from the team names in the gameweeks
+sportradar_team_names = {'Wolverhampton': 'Wolves', 'West Bromwich': 'West Brom', 'Sheffield': 'Sheffield United',
+                         'Man Utd': 'Man United', 'Leed': 'Leeds'}
+
+next_odds_columns = ['shift_date_of_match', 'shift_time_of_match', 'shift_home_team', 'B365H', 'shift_away_team',
+                     'B365A']
+
+# one lock for each url, so rounds fetched at the same time download a shared url once
+url_locks = {}
+url_locks_lock = threading.Lock()
+
+
+def cached_get(url, cache_directory=None, max_age=3600, timeout=30):
+    """
+    Gets the body of a url, from the cache if it was downloaded less than max_age seconds ago.
+
+    :param url: The url to get.
+    :param cache_directory: The directory to cache the responses in. Default is None, which doesn't cache.
+    :param max_age: The number of seconds a cached response is used for.
+    :param timeout: The number of seconds to wait for the server.
+    :return: The body of the response as bytes.
+    """
+    if cache_directory is None:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read()
+
+    with url_locks_lock:
+        lock = url_locks.setdefault(url, threading.Lock())
+    with lock:
+        cache_path = os.path.join(cache_directory, hashlib.sha256(url.encode()).hexdigest())
+        if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < max_age:
+            with open(cache_path, 'rb') as file:
+                return file.read()
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(cache_path + '.tmp', 'wb') as file:
+            file.write(body)
+        os.replace(cache_path + '.tmp', cache_path)
+        return body
+
+
+def fpl_fixtures(next_round, cache_directory=None, api_url=fpl_api_url):
+    """
+    Gets the fixtures of a round from the FPL API. The kickoff time is moved on an hour and the date is the UTC date,
+    the same as the match information in the gameweeks.
+
+    :param next_round: The round to get the fixtures of.
+    :param cache_directory: The directory to cache the responses in, or None.
+    :param api_url: The base url of the FPL API.
+    :return: Dataframe of the 'shift_date_of_match', 'shift_time_of_match', 'shift_home_team' and 'shift_away_team'.
+    """
+    teams = json.loads(cached_get(api_url + 'bootstrap-static/', cache_directory))['teams']
+    team_names = {team['id']: fpl_team_names.get(team['name'], team['name']) for team in teams}
+
+    fixtures = pd.DataFrame(json.loads(cached_get(api_url + 'fixtures/?event={}'.format(next_round), cache_directory)),
+                            columns=['kickoff_time', 'team_h', 'team_a'])
+    kickoff_time = pd.to_datetime(fixtures['kickoff_time'], utc=True)
+    return pd.DataFrame({'shift_date_of_match': kickoff_time.dt.strftime('%Y-%m-%d'),
+                         'shift_time_of_match': (kickoff_time + timedelta(hours=1)).dt.strftime('%H:%M'),
+                         'shift_home_team': fixtures['team_h'].map(team_names),
+                         'shift_away_team': fixtures['team_a'].map(team_names)})
+
+
+def football_data_odds(cache_directory=None, odds_url=fixtures_odds_url):
+    """
+    Gets the BET365 odds of the upcoming Premier League fixtures from Football Data.
+
+    :param cache_directory: The directory to cache the responses in, or None.
+    :param odds_url: The url of the Football Data upcoming fixtures CSV.
+    :return: Dataframe of the 'shift_home_team', 'shift_away_team', 'B365H' and 'B365A'.
+    """
+    odds = pd.read_csv(io.BytesIO(cached_get(odds_url, cache_directory)), encoding='utf-8-sig')
+    odds = odds[odds['Div'] == 'E0'][['HomeTeam', 'AwayTeam', 'B365H', 'B365A']]
+    return odds.rename(columns={'HomeTeam': 'shift_home_team', 'AwayTeam': 'shift_away_team'}).drop_duplicates(
+        subset=['shift_home_team', 'shift_away_team'])
+
+
+def http_next_odds(next_round, cache_directory=None, api_url=fpl_api_url, odds_url=fixtures_odds_url):
+    """
+    Gets the fixtures of a round from the FPL API with their odds from Football Data. Fixtures without odds yet have
+    null odds.
+
+    :param next_round: The round to get the fixtures of.
+    :param cache_directory: The directory to cache the responses in, or None.
+    :param api_url: The base url of the FPL API.
+    :param odds_url: The url of the Football Data upcoming fixtures CSV.
+    :return: The next odds dataframe.
+    """
+    fixtures = fpl_fixtures(next_round, cache_directory, api_url)
+    odds = football_data_odds(cache_directory, odds_url)
+    return fixtures.merge(odds, how='left', on=['shift_home_team', 'shift_away_team'])[next_odds_columns]
+
+
+def parse_sportradar(page_source):
+    """
+    Parses the fixtures and odds out of a sportradar round page.
+
+    :param page_source: The HTML of the page.
+    :return: The next odds dataframe.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    table = soup.find('tbody', attrs={'class': ''})
+    table_rows = table.find_all('tr')
+
+    all_info = []
+    for row in table_rows[1:]:
+        if 'table-subheader no-wrap text-left' in str(row):
+            date = row.text.replace('1X21X2HTFT', '')
+        elif 'row flex-items-xs-middle flex-items-xs-around' in str(row):
+            time_of_match = row.find('td', attrs={'class': 'mobile-width-5 text-center'}).text
+            teams = row.find_all('div', attrs={'class': 'col-xs-5'})
+            home_team = teams[0].text[:-3]
+            away_team = teams[1].text[:-3]
+            odds = row.find_all('div', attrs={'class': 'col-xs-4'})
+            try:
+                home_odds = float(odds[0].text)
+                away_odds = float(odds[2].text)
+            except IndexError:
+                home_odds = np.nan
+                away_odds = np.nan
+            # noinspection PyUnboundLocalVariable
+            all_info.append((date, time_of_match, home_team, home_odds, away_team, away_odds))
+
+    next_odds = pd.DataFrame(all_info, columns=next_odds_columns)
+    next_odds[['shift_home_team', 'shift_away_team']] = next_odds[['shift_home_team', 'shift_away_team']].replace(
+        sportradar_team_names)
+    return next_odds
+
+
+def sportradar_next_odds(next_round, cache_directory=None):
+    """
+    Gets the fixtures and odds of a round by rendering the sportradar page in a headless Chrome. Needs selenium and a
+    chromedriver, so it is only used if asked for.
+
+    :param next_round: The round to get the fixtures of.
+    :param cache_directory: Not used, the page is always rendered.
+    :return: The next odds dataframe.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.headless = True
+    driver = webdriver.Chrome(executable_path='/Users/danielheaver/Desktop/chromedriver', options=chrome_options)
+    try:
+        driver.get(sportradar_url.format(next_round))
+        time.sleep(2)
+        return parse_sportradar(driver.page_source)
+    finally:
+        driver.quit()
+
+
+# every source of the next fixtures and odds, each a function of (next_round, cache_directory) -> next odds dataframe
+fixture_sources = {'http': http_next_odds, 'sportradar': sportradar_next_odds}
+
+
+def get_next_odds(rounds, source='http', cache_directory=None, workers=4):
+    """
+    Gets the fixtures and odds of the upcoming rounds from a source, fetching the rounds at the same time.
+
+    :param rounds: Iterable of the rounds to get.
+    :param source: The name of a source in fixture_sources, or a function of (next_round, cache_directory).
+    :param cache_directory: The directory to cache the responses in. Default is None, which doesn't cache.
+    :param workers: The number of rounds to fetch at once.
+    :return: Dictionary of round: the next odds dataframe of that round, with the 'shift_month_of_match' added.
+    """
+    source = fixture_sources[source] if isinstance(source, str) else source
+    rounds = list(rounds)
+    with ThreadPoolExecutor(workers) as executor:
+        all_odds = list(executor.map(lambda next_round: source(next_round, cache_directory), rounds))
+    for next_odds in all_odds:
+        next_odds['shift_month_of_match'] = pd.to_datetime(next_odds['shift_date_of_match']).dt.month
+    return dict(zip(rounds, all_odds))
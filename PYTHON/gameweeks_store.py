@@ -0,0 +1,93 @@
+import os
+import glob
+import pandas as pd
+
+
+def store_directory(path=None):
+    """
+    The directory the all_gameweeks dataset is saved in, with one Parquet file for each season.
+
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: The path to the all_gameweeks directory.
+    """
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    return path + 'CSV/all_gameweeks/'
+
+
+def saved_seasons(path=None):
+    """
+    Gets the seasons that are saved in the all_gameweeks dataset.
+
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: A sorted list of the saved seasons, which is empty if all_gameweeks has not been saved yet.
+    """
+    return sorted(os.path.basename(file)[:-len('.parquet')] for file in glob.glob(store_directory(path) + '*.parquet'))
+
+
+def typed_columns(gameweeks_dataframe):
+    """
+    Gives the columns the same types they would have when read back from a CSV, so every season is saved with the same
+    schema. The shifted points range is stored as a float rather than a category and the true/false columns as 0/1.
+
+    :param gameweeks_dataframe: The gameweeks dataframe to save.
+    :return: The gameweeks dataframe with plain numeric and string columns.
+    """
+    dataframe = gameweeks_dataframe.copy()
+    for column in dataframe.columns[dataframe.dtypes == bool]:
+        dataframe[column] = dataframe[column].astype(int)
+    dataframe['date_of_match'] = dataframe['date_of_match'].astype(str)
+    dataframe['shift_points_range'] = dataframe['shift_points_range'].astype(float)
+    return dataframe
+
+
+def save_gameweeks(gameweeks_dataframe, seasons=None, path=None):
+    """
+    Saves the all_gameweeks dataframe as a Parquet file for each season. Each file is written to a temporary file first
+    and then moved into place, so a reader never sees a half written season.
+
+    :param gameweeks_dataframe: The concatenated gameweeks dataframe.
+    :param seasons: The seasons to save. Default is None, which saves every season in the dataframe and removes any
+                    saved season that is no longer in it.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
+    directory = store_directory(path)
+    os.makedirs(directory, exist_ok=True)
+
+    gameweeks_dataframe = typed_columns(gameweeks_dataframe)
+    if seasons is None:
+        seasons = list(gameweeks_dataframe['season'].unique())
+        for season in set(saved_seasons(path)) - set(seasons):
+            os.remove(directory + season + '.parquet')
+
+    for season, season_df in gameweeks_dataframe[gameweeks_dataframe['season'].isin(seasons)].groupby('season'):
+        file = directory + season + '.parquet'
+        season_df.to_parquet(file + '.tmp', index=False)
+        os.replace(file + '.tmp', file)
+
+
+def load_gameweeks(columns=None, seasons=None, rounds=None, path=None):
+    """
+    Loads the all_gameweeks dataframe, reading only the seasons, rounds and columns that are asked for. The files are
+    memory mapped, so the columns are not copied more than Parquet needs to decode them.
+
+    :param columns: The columns to read. Default is None, which reads every column.
+    :param seasons: The seasons to read. Default is None, which reads every saved season.
+    :param rounds: The (first, last) rounds to read, where either can be None to leave that end open. Default is None,
+                   which reads every round.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :return: The gameweeks dataframe, with the seasons in order.
+    """
+    filters = []
+    if rounds is not None:
+        if rounds[0] is not None:
+            filters.append(('round', '>=', rounds[0]))
+        if rounds[1] is not None:
+            filters.append(('round', '<=', rounds[1]))
+
+    seasons_to_read = [season for season in saved_seasons(path) if seasons is None or season in seasons]
+    if not seasons_to_read:
+        raise FileNotFoundError('No saved all_gameweeks seasons to read in ' + store_directory(path))
+
+    return pd.concat([pd.read_parquet(store_directory(path) + season + '.parquet', columns=columns,
+                                      filters=filters or None, memory_map=True) for season in seasons_to_read],
+                     ignore_index=True)
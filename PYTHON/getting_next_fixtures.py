@@ -1,63 +1,40 @@
 import sqlite3
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import time as t
-from bs4 import BeautifulSoup
-import numpy as np
 import PYTHON.data_cleaning_functions as dcf
+import PYTHON.gameweeks_store as gws
+import PYTHON.fixture_sources as fs
 
 
-def get_next_fixtures():
+def get_next_fixtures(persist=False, source='http', path=None):
+    """
+    Gets the upcoming fixtures with their odds and each players form going into them, and saves them as next_fixtures.
 
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    :param persist: Whether to persist the joined tables to the seasons SQL database for debugging. Default is False,
+                    which does every join in memory without touching the database.
+    :param source: {'http', 'sportradar'} or a function of (next_round, cache_directory), where the fixtures and odds
+                   come from. See fixture_sources.
+                   'http': The FPL API fixtures with the Football Data odds, cached in CSV/fixture_cache.
+                   'sportradar': Scrape the sportradar page with a headless Chrome.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
 
-    db_connection = sqlite3.connect(path + 'seasons.sqlite')
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
 
-    gameweeks = pd.read_csv(path + 'CSV/all_gameweeks.csv')
+    db_connection = sqlite3.connect(path + 'seasons.sqlite') if persist else None
 
-    next_fixtures = gameweeks[(gameweeks['season'] == '2020-21') & (gameweeks['shift_points_range'].isnull()) &
-                              (gameweeks['round'] >= max(gameweeks[gameweeks['season'] == '2020-21']['round']) - 5)].copy()
+    current_season = gws.load_gameweeks(seasons=['2020-21'], path=path)
+
+    next_fixtures = current_season[(current_season['shift_points_range'].isnull()) &
+                                   (current_season['round'] >= max(current_season['round']) - 5)].copy()
+
+    # only the columns for each players recent form and head to head form are needed from the older seasons
+    gameweeks = gws.load_gameweeks(columns=['name', 'opponent_team', 'date_of_match'] + list(dcf.rolling_statistics),
+                                   path=path)
 
     next_round = max(next_fixtures['round']) + 1
 
     next_fixtures.dropna(axis=1, inplace=True)
 
-    chrome_options = Options()
-    chrome_options.headless = True
-    driver = webdriver.Chrome(executable_path='/Users/danielheaver/Desktop/chromedriver', options=chrome_options)
-    driver.get('https://s5.sir.sportradar.com/bet365/en/1/season/77179/fixtures/round/21-{}'.format(next_round))
-    t.sleep(2)
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-    table = soup.find('tbody', attrs={'class': ''})
-    table_rows = table.find_all('tr')
-
-    all_info = []
-    for row in table_rows[1:]:
-        if 'table-subheader no-wrap text-left' in str(row):
-            date = row.text.replace('1X21X2HTFT', '')
-        elif 'row flex-items-xs-middle flex-items-xs-around' in str(row):
-            time = row.find('td', attrs={'class': 'mobile-width-5 text-center'}).text
-            teams = row.find_all('div', attrs={'class': 'col-xs-5'})
-            home_team = teams[0].text[:-3]
-            away_team = teams[1].text[:-3]
-            odds = row.find_all('div', attrs={'class': 'col-xs-4'})
-            try:
-                home_odds = float(odds[0].text)
-                away_odds = float(odds[2].text)
-            except IndexError:
-                home_odds = np.nan
-                away_odds = np.nan
-            # noinspection PyUnboundLocalVariable
-            all_info.append((date, time, home_team, home_odds, away_team, away_odds))
-
-    next_odds = pd.DataFrame(all_info, columns=['shift_date_of_match', 'shift_time_of_match', 'shift_home_team', 'B365H',
-                                                'shift_away_team', 'B365A'])
-
-    next_odds['shift_month_of_match'] = pd.to_datetime(next_odds['shift_date_of_match']).dt.month
-
-    next_odds[['shift_home_team', 'shift_away_team']] = next_odds[['shift_home_team', 'shift_away_team']].replace({'Wolverhampton': 'Wolves', 'West Bromwich': 'West Brom', 'Sheffield': 'Sheffield United', 'Man Utd': 'Man United', 'Leed': 'Leeds'})
+    next_odds = fs.get_next_odds([next_round], source, path + 'CSV/fixture_cache/')[next_round]
 
     next_fixtures = dcf.next_odds_joiner(next_fixtures, next_odds, db_connection)
 
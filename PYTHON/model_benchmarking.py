@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import hashlib
+import queue
+import signal
+import multiprocessing
+import numpy as np
+import pandas as pd
+import sklearn
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import precision_score, recall_score, f1_score
+from threadpoolctl import threadpool_limits
+import PYTHON.modeling_functions as mf
+from PYTHON.process_stats import peak_rss_mb
+
+# the data and folds each worker process fits on, and the queue it reports the tasks it starts on, set once when the
+# worker starts
+worker_data = {}
+
+
+def data_hash(*arrays):
+    """
+    Gets a hash of the contents of the training and test data, so a cached result is only used with the same data.
+
+    :param arrays: The dense arrays, sparse matrices or series to hash.
+    :return: The hex digest of the hash.
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        if sparse.issparse(array):
+            array = array.tocsr()
+            parts = [array.data, array.indices, array.indptr, np.array(array.shape)]
+        else:
+            parts = [np.asarray(array)]
+        for part in parts:
+            digest.update(str(part.dtype).encode())
+            digest.update(np.ascontiguousarray(part).tobytes() if part.dtype != object else repr(list(part)).encode())
+    return digest.hexdigest()
+
+
+def model_key(model, data_key, task):
+    """
+    Gets the cache key of a task, made from the model type and parameters, the scikit-learn version, the data hash and
+    which fold or test the task is.
+
+    :param model: The unfitted model.
+    :param data_key: The hash of the data from data_hash.
+    :param task: The name of the task, 'fold_<number>' or 'test'.
+    :return: The hex digest of the key.
+    """
+    params = sorted((name, repr(value)) for name, value in model.get_params(deep=True).items())
+    description = repr((type(model).__module__, type(model).__name__, params, sklearn.__version__, data_key, task))
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def load_cache(cache_path):
+    """
+    Loads the saved task results.
+
+    :param cache_path: The path to the JSON cache file.
+    :return: Dictionary of the cache keys to the task results, which is empty if nothing has been cached yet.
+    """
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as file:
+        return json.load(file)
+
+
+def save_cache(cache, cache_path):
+    """
+    Saves the task results, writing to a temporary file first so an interrupted run can't leave half a cache.
+
+    :param cache: Dictionary of the cache keys to the task results.
+    :param cache_path: The path to the JSON cache file.
+    """
+    with open(cache_path + '.tmp', 'w') as file:
+        json.dump(cache, file)
+    os.replace(cache_path + '.tmp', cache_path)
+
+
+def is_cached(result, timeout):
+    """
+    Whether a cached task result can be used. A task that failed, e.g. it crashed or ran out of memory, is always run
+    again, since the failure may not happen next time. A task that timed out is run again if it now has longer to run.
+
+    :param result: The cached task result, or None if the task is not cached.
+    :param timeout: The timeout of this run, or None for no limit.
+    :return: Whether to use the cached result.
+    """
+    if result is None or (result.get('error') and not result.get('timed_out')):
+        return False
+    return not result.get('timed_out') or (timeout is not None and timeout <= result['timeout'])
+
+
+def start_worker(data, folds, started):
+    """
+    Stores the data and folds in the worker process once, so each task only sends its model, and limits the worker to
+    a single BLAS/OpenMP thread, so the number of workers is the number of cores used.
+
+    :param data: (x_train, x_test, y_train, y_test)
+    :param folds: Dictionary of task name to its (train_rows, validation_rows), which are None for the test task.
+    :param started: The queue each task puts its (key, process id, start time) on when it starts.
+    """
+    worker_data.update(data=data, folds=folds, started=started)
+    threadpool_limits(1)
+
+
+def run_task(key, model, task_name):
+    """
+    Fits a model for a single cross-validation fold or for the final train-test evaluation in a worker process.
+
+    :param key: The cache key of the task.
+    :param model: The unfitted model.
+    :param task_name: The name of the task, 'fold_<number>' or 'test'.
+    :return: (key, result), where the result dictionary has the scores, 'wall_time', 'cpu_time', 'peak_rss_mb' of the
+             worker process so far and the 'error' if the fit failed.
+    """
+    worker_data['started'].put((key, os.getpid(), time.time()))
+    model = clone(model)
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=1)
+
+    data = worker_data['data']
+    train_rows, validation_rows = worker_data['folds'][task_name]
+    x_train, x_test = mf.dense_if_needed(model, data[0]), mf.dense_if_needed(model, data[1])
+    y_train, y_test = np.asarray(data[2]), np.asarray(data[3])
+    result = {'task': task_name}
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        if train_rows is not None:
+            model.fit(x_train[train_rows], y_train[train_rows])
+            result['cv_score'] = model.score(x_train[validation_rows], y_train[validation_rows])
+        else:
+            model.fit(x_train, y_train)
+            predictions = model.predict(x_test)
+            result.update(train_score=model.score(x_train, y_train), test_score=model.score(x_test, y_test),
+                          precision=precision_score(y_test, predictions, average='weighted'),
+                          recall=recall_score(y_test, predictions, average='weighted'),
+                          f1=f1_score(y_test, predictions, average='weighted'))
+    except Exception as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    result.update(wall_time=time.perf_counter() - start_wall, cpu_time=time.process_time() - start_cpu,
+                  peak_rss_mb=peak_rss_mb())
+    return key, result
+
+
+def process_exists(pid):
+    """
+    Whether a process is still running.
+
+    :param pid: The process id.
+    :return: True if the process exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def run_tasks(tasks, data, folds, workers, timeout, poll_seconds=1):
+    """
+    Runs the tasks in a pool of worker processes that are sent the data once when they start. A task still running
+    after the timeout has its worker process killed, which the pool replaces, so the other tasks carry on. A task
+    whose worker exits without a result, e.g. because it ran out of memory, is recorded with an error.
+
+    :param tasks: List of (key, model, task_name).
+    :param data: (x_train, x_test, y_train, y_test)
+    :param folds: Dictionary of task name to its (train_rows, validation_rows), which are None for the test task.
+    :param workers: The number of processes to run at once.
+    :param timeout: The number of seconds a task can run for, or None for no limit.
+    :param poll_seconds: How often to check for tasks that timed out or whose worker exited.
+    :return: Generator of (key, result) in the order the tasks finish.
+    """
+    if not tasks:
+        return
+    task_names = {key: task_name for key, _, task_name in tasks}
+    # written to straight away, unlike a Queue's background thread, so a task whose worker dies has still been seen
+    started = multiprocessing.SimpleQueue()
+    done = queue.Queue()
+    # the process id and start time of each task that is running
+    running = {}
+
+    def failed(key, seconds, error, **extra):
+        return key, {'task': task_names[key], 'wall_time': seconds, 'cpu_time': np.nan, 'peak_rss_mb': np.nan,
+                     'error': error, **extra}
+
+    pool = multiprocessing.Pool(min(workers, len(tasks)), initializer=start_worker, initargs=(data, folds, started))
+    try:
+        for key, model, task_name in tasks:
+            pool.apply_async(run_task, (key, model, task_name), callback=done.put,
+                             error_callback=lambda error, key=key: done.put(
+                                 failed(key, 0, '{}: {}'.format(type(error).__name__, error))))
+
+        remaining = set(task_names)
+        while remaining:
+            while not started.empty():
+                key, pid, start = started.get()
+                if key in remaining:
+                    running[key] = (pid, start)
+
+            wait_for = poll_seconds
+            if timeout is not None and running:
+                wait_for = min(wait_for, max(0, min(start for _, start in running.values()) + timeout - time.time()))
+            try:
+                key, result = done.get(timeout=wait_for)
+            except queue.Empty:
+                pass
+            else:
+                if key in remaining:
+                    remaining.discard(key)
+                    running.pop(key, None)
+                    yield key, result
+                continue
+
+            for key, (pid, start) in list(running.items()):
+                if timeout is not None and time.time() - start >= timeout:
+                    os.kill(pid, signal.SIGTERM)
+                    result = failed(key, time.time() - start, 'Timed out after {}s'.format(timeout), timed_out=True,
+                                    timeout=timeout)
+                elif not process_exists(pid):
+                    result = failed(key, time.time() - start, 'The worker process exited without a result')
+                else:
+                    continue
+                remaining.discard(key)
+                del running[key]
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def summarise_model(model, results):
+    """
+    Combines the results of a models folds and test task into a row of model scores.
+
+    :param model: The model.
+    :param results: List of the task results of the model.
+    :return: Dictionary of the model scores.
+    """
+    folds = [result for result in results if result['task'] != 'test']
+    test = [result for result in results if result['task'] == 'test'][0]
+    errors = [result['task'] + ': ' + result['error'] for result in results if 'error' in result]
+    wall_time = sum(result['wall_time'] for result in results)
+    return {'Model': model,
+            'Mean CV Score': np.mean([fold['cv_score'] for fold in folds])
+            if all('cv_score' in fold for fold in folds) else np.nan,
+            'Train Score': test.get('train_score', np.nan), 'Test Score': test.get('test_score', np.nan),
+            'Precision Score': test.get('precision', np.nan), 'Recall Score': test.get('recall', np.nan),
+            'f1 Score': test.get('f1', np.nan), 'Time Taken (s)': pd.Timedelta(seconds=wall_time),
+            'CPU Time (s)': sum(result['cpu_time'] for result in results),
+            'Peak RSS (MB)': pd.Series([result['peak_rss_mb'] for result in results]).max(),
+            'Error': '; '.join(errors) or None}
+
+
+def benchmark_models(models, x_train, x_test, y_train, y_test, cache_path, cv=5, workers=None, timeout=None):
+    """
+    Evaluates the models the same way as classification_evaluation, but with every cross-validation fold and final fit
+    as a separate task run across a pool of processes, which are sent the data once when they start. Each task runs
+    single threaded, so the number of workers is the number of cores in use. The peak RSS of a task is the high-water
+    mark of its worker process, which includes the tasks that worker ran before it. Results are cached by the model
+    parameters and a hash of the data, so a re-run only fits the models that changed. Failures are recorded with their
+    error instead of being thrown away, and are run again next time.
+
+    :param models: List of the unfitted models to evaluate.
+    :param x_train: The training predictors.
+    :param x_test: The test predictors.
+    :param y_train: The training labels.
+    :param y_test: The test labels.
+    :param cache_path: The path to the JSON file the task results are cached in.
+    :param cv: The number of folds in the cross-validation.
+    :param workers: The number of processes to run at once. Default is None, which uses every core.
+    :param timeout: The number of seconds a single task can run for before it is stopped. Default is None, no limit.
+    :return: Dataframe of the model scores, with the wall time, CPU time, peak RSS and any error of each model.
+    """
+    data_key = data_hash(x_train, x_test, y_train, y_test)
+    folds = list(StratifiedKFold(n_splits=cv).split(np.zeros(len(y_train)), y_train)) + [(None, None)]
+    task_names = ['fold_{}'.format(fold) for fold in range(cv)] + ['test']
+
+    cache = load_cache(cache_path)
+    keys = [[model_key(model, data_key, task_name) for task_name in task_names] for model in models]
+    tasks = [(key, model, task_name) for model, model_keys in zip(models, keys)
+             for key, task_name in zip(model_keys, task_names) if not is_cached(cache.get(key), timeout)]
+
+    for key, result in run_tasks(tasks, (x_train, x_test, y_train, y_test), dict(zip(task_names, folds)),
+                                 workers or os.cpu_count(), timeout):
+        cache[key] = result
+        save_cache(cache, cache_path)
+
+    return pd.DataFrame([summarise_model(model, [cache[key] for key in model_keys])
+                         for model, model_keys in zip(models, keys)])
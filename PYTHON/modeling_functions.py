@@ -1,20 +1,32 @@
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.compose import ColumnTransformer
-import numpy as np
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.naive_bayes import GaussianNB, CategoricalNB
+from scipy import sparse
 from datetime import datetime
 from sklearn.metrics import precision_score, recall_score, f1_score
+import pickle
 
+# bumped whenever the saved feature pipeline changes shape, so an old artifact is never used with new code
+feature_pipeline_version = 2
 
-def split_and_scale(predictors, labels, scaler, numerical_columns, test_size=0.2, stratify=None, random_state=1):
+# models that need their predictors as a dense array
+dense_only_models = (GaussianNB, CategoricalNB)
+
+
+def split_and_scale(predictors, labels, scaler, numerical_columns, categorical_columns, test_size=0.2, stratify=None,
+                    random_state=1):
     """
-    Performs a train-test split and then transforms the numerical columns in both the training and test sets using a
-     feature scaler that is fitted to the training set. The feature names are therefore the same as the
-     dummified predictors columns.
+    Performs a train-test split and then transforms both the training and test sets with a transformer that is fitted
+    to the training set. The numerical columns are feature scaled and the categorical columns are one hot encoded
+    straight into a sparse matrix, so the mostly zero dummy columns are never stored. Categories that were not in the
+    training set are ignored when transforming.
 
-    :param predictors: The dummified predictors.
+    :param predictors: The predictors, with the categorical columns not dummified.
     :param labels: Corresponding labels.
     :param scaler: The feature scaler to transform the numerical columns in the predictors.
     :param numerical_columns: The columns to feature scale.
+    :param categorical_columns: The columns to one hot encode.
     :param test_size: The size of the test size in the train-test split.
     :param stratify: How to stratify the train-test split. Default is None.
     :param random_state: The random state of the train-test split.
@@ -22,11 +34,25 @@ def split_and_scale(predictors, labels, scaler, numerical_columns, test_size=0.2
     """
     x_train, x_test, y_train, y_test = train_test_split(predictors, labels, test_size=test_size, stratify=stratify,
                                                         random_state=random_state)
-    transformer = ColumnTransformer([('numerical', scaler, numerical_columns)],
-                                    remainder='passthrough')
-    x_train = transformer.fit_transform(x_train)
-    x_test = transformer.transform(x_test)
-    return np.array(x_train), np.array(x_test), y_train, y_test, transformer
+    transformer = ColumnTransformer([('numerical', scaler, numerical_columns),
+                                     ('categorical', OneHotEncoder(handle_unknown='ignore'), categorical_columns)],
+                                    sparse_threshold=1)
+    x_train = transformer.fit_transform(x_train).tocsr()
+    x_test = transformer.transform(x_test).tocsr()
+    return x_train, x_test, y_train, y_test, transformer
+
+
+def dense_if_needed(model, predictors):
+    """
+    Turns the sparse predictors into a dense array for the models that can't be fitted on a sparse matrix.
+
+    :param model: The model that the predictors are for.
+    :param predictors: The sparse predictors.
+    :return: The predictors as a dense array if the model needs one, otherwise the sparse predictors.
+    """
+    if isinstance(model, dense_only_models) and sparse.issparse(predictors):
+        return predictors.toarray()
+    return predictors
 
 
 def classification_evaluation(model, x_train, x_test, y_train, y_test, cv=5):
@@ -53,3 +79,42 @@ def classification_evaluation(model, x_train, x_test, y_train, y_test, cv=5):
     f1 = f1_score(y_test, predictions, average='weighted')
     time_taken = datetime.now() - start_time
     return cv_score, train_score, test_score, precision, recall, f1, time_taken
+
+
+def save_feature_pipeline(file_path, transformer):
+    """
+    Saves everything needed to turn new observations into model features, so predictions don't need to rebuild them
+    from the training data.
+
+    :param file_path: The path to save the feature pipeline to.
+    :param transformer: The fitted transformer from split_and_scale.
+    """
+    feature_pipeline = {'version': feature_pipeline_version, 'transformer': transformer}
+    with open(file_path, 'wb') as file:
+        pickle.dump(feature_pipeline, file)
+
+
+def load_feature_pipeline(file_path):
+    """
+    Loads a feature pipeline saved by save_feature_pipeline.
+
+    :param file_path: The path the feature pipeline was saved to.
+    :return: Dictionary with the fitted 'transformer'.
+    """
+    with open(file_path, 'rb') as file:
+        feature_pipeline = pickle.load(file)
+    if feature_pipeline.get('version') != feature_pipeline_version:
+        raise ValueError('The feature pipeline at {} is version {}, but version {} is needed. Retrain the model to save '
+                         'a new one.'.format(file_path, feature_pipeline.get('version'), feature_pipeline_version))
+    return feature_pipeline
+
+
+def transform_features(predictors, feature_pipeline):
+    """
+    Scales and one hot encodes new observations the same way as the training set.
+
+    :param predictors: The dataframe of the observations to predict.
+    :param feature_pipeline: The feature pipeline from load_feature_pipeline.
+    :return: The model features of the observations as a sparse matrix.
+    """
+    return feature_pipeline['transformer'].transform(predictors).tocsr()
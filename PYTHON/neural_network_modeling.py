@@ -1,13 +1,190 @@
+import os
+import time
+import queue
+import warnings
+import multiprocessing
+import numpy as np
+import pandas as pd
 from sklearn.neural_network import MLPClassifier
-from sklearn.model_selection import GridSearchCV
-from PYTHON.modeling_preperation import x_train, y_train
+from sklearn.model_selection import train_test_split
+from sklearn.base import clone
+from threadpoolctl import threadpool_limits
+from PYTHON.modeling_preperation import x_train, y_train, transformer
+import PYTHON.modeling_functions as mf
 import pickle
 
+# the values the search samples each MLPs hidden layers, L2 penalty and initial learning rate from
+hidden_layer_options = [(100, ), (300, ), (600, ), (300, 300, ), (600, 600, )]
+alpha_range = (1e-5, 1e-1)
+learning_rate_range = (1e-4, 1e-2)
+
+# the data each search worker process trains and validates on, set once when the worker starts
+worker_data = {}
+
 
 def train_model():
 
+    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+
     model = MLPClassifier(solver='sgd', hidden_layer_sizes=(600, 600, ), max_iter=1000)
 
     model.fit(x_train, y_train)
 
-    pickle.dump(gridsearch.best_estimator_, open('/Users/danielheaver/Desktop/projects/fantasy_football_predictions/best_model.sav', 'wb'))
+    pickle.dump(model, open(path + 'best_model.sav', 'wb'))
+
+    mf.save_feature_pipeline(path + 'feature_pipeline.sav', transformer)
+
+
+def sample_candidates(number_of_candidates, random_state=1):
+    """
+    Samples MLP candidates for the search, with the L2 penalty and learning rate sampled on a log scale.
+
+    :param number_of_candidates: The number of candidates to sample.
+    :param random_state: The random state of the sampling and of each MLP.
+    :return: List of unfitted MLPClassifiers that warm start and stop early when their internal validation score stops
+             improving.
+    """
+    random = np.random.RandomState(random_state)
+    return [MLPClassifier(hidden_layer_sizes=hidden_layer_options[random.randint(len(hidden_layer_options))],
+                          alpha=10 ** random.uniform(*np.log10(alpha_range)),
+                          learning_rate_init=10 ** random.uniform(*np.log10(learning_rate_range)),
+                          solver='adam', early_stopping=True, warm_start=True, random_state=random_state)
+            for _ in range(number_of_candidates)]
+
+
+def start_search_worker(x_fit, y_fit, x_validation, y_validation):
+    """
+    Stores the data in the worker process and limits it to a single BLAS/OpenMP thread, so the number of workers is
+    the number of cores used.
+    """
+    worker_data.update(x_fit=x_fit, y_fit=y_fit, x_validation=x_validation, y_validation=y_validation)
+    threadpool_limits(1)
+    warnings.filterwarnings('ignore')
+
+
+def train_candidate(model, epochs):
+    """
+    Trains a candidate for more epochs, carrying on from where its last rung finished.
+
+    :param model: The candidate MLP, fitted in the last rung or unfitted.
+    :param epochs: The number of epochs to train it for.
+    :return: (model, validation_score, total_epochs_trained, stopped_early), where the total counts the epochs of every
+             rung so far. A warm started fit only counts its own epochs in n_iter_, but adds them all to loss_curve_.
+    """
+    model.set_params(max_iter=epochs)
+    model.fit(worker_data['x_fit'], worker_data['y_fit'])
+    stopped_early = model.n_iter_ < epochs
+    return (model, model.score(worker_data['x_validation'], worker_data['y_validation']), len(model.loss_curve_),
+            stopped_early)
+
+
+def successive_halving(candidates, x_fit, y_fit, x_validation, y_validation, min_epochs=5, eta=3, budget_seconds=3600,
+                       workers=None):
+    """
+    Runs a successive halving search. Every candidate is trained for min_epochs, then the best 1/eta of them are warm
+    started and trained for eta times as many epochs, and so on until one is left. Candidates that stop early keep
+    their score without training further. The candidates in a rung are trained in parallel, and once the budget runs
+    out the worker processes are terminated, stopping the training still running, and the best candidate so far wins.
+    The budget is only enforced once a candidate has finished its first rung, so there is always a model to return.
+
+    :param candidates: List of unfitted warm starting MLPs from sample_candidates.
+    :param x_fit: The predictors to train on.
+    :param y_fit: The labels to train on.
+    :param x_validation: The predictors to score the candidates on.
+    :param y_validation: The labels to score the candidates on.
+    :param min_epochs: The number of epochs every candidate is trained for in the first rung.
+    :param eta: The fraction of candidates, as 1/eta, that go through to each next rung.
+    :param budget_seconds: The wall-clock time the search can take.
+    :param workers: The number of processes to train in. Default is None, which uses every core.
+    :return: (best_model, dataframe_of_every_candidates_score_in_each_rung)
+    """
+    if not candidates:
+        raise ValueError('There are no candidates to search.')
+    deadline = time.perf_counter() + budget_seconds
+    models = dict(enumerate(candidates))
+    scores = {}
+    finished = set()
+    results = []
+
+    pool = multiprocessing.Pool(workers or os.cpu_count(), initializer=start_search_worker,
+                                initargs=(x_fit, y_fit, x_validation, y_validation))
+    # the results of the fits as (candidate, result, error), put there by the pools result thread
+    done = queue.Queue()
+    try:
+        rung = 0
+        while True:
+            epochs = min_epochs * eta ** rung
+            training = {candidate for candidate in models if candidate not in finished}
+            for candidate in training:
+                pool.apply_async(train_candidate, (models[candidate], epochs),
+                                 callback=lambda result, candidate=candidate: done.put((candidate, result, None)),
+                                 error_callback=lambda error, candidate=candidate: done.put((candidate, None, error)))
+            while training:
+                try:
+                    candidate, result, error = done.get(timeout=max(0, deadline - time.perf_counter())
+                                                        if scores else None)
+                except queue.Empty:
+                    break
+                if error is not None:
+                    raise error
+                training.remove(candidate)
+                models[candidate], scores[candidate], epochs_trained, stopped_early = result
+                if stopped_early:
+                    finished.add(candidate)
+                results.append({'rung': rung, 'candidate': candidate, 'epochs': epochs_trained,
+                                'validation_score': scores[candidate], 'stopped_early': stopped_early,
+                                **{param: models[candidate].get_params()[param]
+                                   for param in ['hidden_layer_sizes', 'alpha', 'learning_rate_init']}})
+
+            if len(models) == 1 or time.perf_counter() >= deadline:
+                break
+            survivors = sorted((candidate for candidate in models if candidate in scores), key=scores.get,
+                               reverse=True)[:max(1, len(models) // eta)]
+            models = {candidate: models[candidate] for candidate in survivors}
+            rung += 1
+    finally:
+        # terminating stops any fits still running when the budget ran out
+        pool.terminate()
+        pool.join()
+
+    scored = [candidate for candidate in models if candidate in scores]
+    if not scored:
+        raise ValueError('No candidate finished training, so there is no model to return.')
+    best = max(scored, key=scores.get)
+    return models[best], pd.DataFrame(results)
+
+
+def search_model(number_of_candidates=27, min_epochs=5, eta=3, budget_seconds=3600, workers=None, random_state=1):
+    """
+    Searches for the best MLP hidden layers, L2 penalty and learning rate with successive halving on a validation split
+    of the training set. The winner is refit on the whole training set with early stopping and saved as the best model
+    with its feature pipeline, and the search results are saved as mlp_search.
+
+    :param number_of_candidates: The number of candidates to sample.
+    :param min_epochs: The number of epochs every candidate is trained for in the first rung.
+    :param eta: The fraction of candidates, as 1/eta, that go through to each next rung.
+    :param budget_seconds: The wall-clock time the search can take, not counting the final refit.
+    :param workers: The number of processes to train in. Default is None, which uses every core.
+    :param random_state: The random state of the sampling, the validation split and each MLP.
+    :return: The refit best model.
+    """
+
+    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+
+    x_fit, x_validation, y_fit, y_validation = train_test_split(x_train, y_train, test_size=0.2, stratify=y_train,
+                                                                random_state=random_state)
+
+    candidates = sample_candidates(number_of_candidates, random_state)
+    best_model, search_results = successive_halving(candidates, x_fit, y_fit, x_validation, y_validation, min_epochs,
+                                                    eta, budget_seconds, workers)
+
+    model = clone(best_model).set_params(warm_start=False, max_iter=1000)
+    model.fit(x_train, y_train)
+
+    pickle.dump(model, open(path + 'best_model.sav', 'wb'))
+
+    mf.save_feature_pipeline(path + 'feature_pipeline.sav', transformer)
+
+    search_results.to_csv(path + 'CSV/mlp_search.csv', index=False)
+
+    return model
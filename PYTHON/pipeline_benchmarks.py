@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import shutil
+import pickle
+import warnings
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sklearn.linear_model import LogisticRegression
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.preprocessing import MinMaxScaler
+import PYTHON.data_cleaning_functions as dcf
+import PYTHON.modeling_functions as mf
+import PYTHON.gameweeks_store as gws
+from PYTHON.finished_seasons_cleaner import clean_season, clean_finished_seasons
+from PYTHON.season_concatenator import season_concatenator
+from PYTHON.getting_next_fixtures import get_next_fixtures
+from PYTHON.predicting_next_fixtures import get_predictions
+from PYTHON.best_predicted_squad import get_best_squad
+from PYTHON.pipeline_instrumentation import PipelineTrace
+
+number_of_teams = 20
+
+# the share of the players in each position, by element_type from 1 (GK) to 4 (FWD), and the points each scores for a
+# goal and a clean sheet
+position_shares = {1: 0.1, 2: 0.33, 3: 0.37, 4: 0.2}
+goal_points = {1: 6, 2: 6, 3: 5, 4: 4}
+clean_sheet_points = {1: 4, 2: 4, 3: 1, 4: 0}
+goal_rates = {1: 0.0, 2: 0.04, 3: 0.12, 4: 0.35}
+
+kickoff_times = ['11:30', '14:00', '16:30', '19:00']
+
+# the categorical columns of the model, the same as in modeling_preperation
+categorical = ['season', 'name', 'position', 'plays_for', 'opponent_team', 'was_home', 'won', 'month_of_match',
+               'time_of_match', 'shift_opponent', 'shift_month_of_match', 'shift_time_of_match', 'shift_was_home']
+
+
+def synthetic_teams():
+    """
+    :return: List of the synthetic team names, which sort in the order of their team number.
+    """
+    return ['Team {:02d}'.format(team) for team in range(1, number_of_teams + 1)]
+
+
+def synthetic_schedule(season):
+    """
+    Makes a double round robin season of 38 rounds, a week apart from the second weekend of August.
+
+    :param season: The season, e.g. '2020-21'.
+    :return: Dataframe of the 'round', 'fixture', 'home' and 'away' team numbers from 0 and the 'kickoff_time'.
+    """
+    teams = list(range(number_of_teams))
+    fixtures = []
+    for first_half_round in range(1, number_of_teams):
+        for i in range(number_of_teams // 2):
+            home, away = teams[i], teams[-1 - i]
+            fixtures.append((first_half_round, away, home) if first_half_round % 2 else (first_half_round, home, away))
+        teams = [teams[0], teams[-1]] + teams[1:-1]
+    fixtures += [(first_half_round + number_of_teams - 1, away, home) for first_half_round, home, away in fixtures]
+
+    schedule = pd.DataFrame(fixtures, columns=['round', 'home', 'away'])
+    schedule.insert(1, 'fixture', range(1, len(schedule) + 1))
+    random = np.random.RandomState(int(season[:4]))
+    first_round = datetime(int(season[:4]), 8, 8)
+    schedule['kickoff_time'] = [(first_round + timedelta(weeks=int(next_round) - 1, days=int(day))).strftime(
+        '%Y-%m-%dT{}:00Z'.format(kickoff)) for next_round, day, kickoff in
+        zip(schedule['round'], random.randint(0, 3, len(schedule)), random.choice(kickoff_times, len(schedule)))]
+    return schedule
+
+
+def synthetic_players(players_per_team=30, random_state=0):
+    """
+    Makes the players of every team, who keep the same name, team, position, quality and value in every season. The
+    quality scales how often a player plays and their statistics, so the model has something to learn, and most
+    players are cheap with a long tail of expensive ones, with the better players costing more.
+
+    :param players_per_team: The number of players in each team.
+    :param random_state: The random state of the players.
+    :return: Dataframe of each players 'element', 'first_name', 'second_name', 'team' number, 'element_type',
+             'quality' and 'value'.
+    """
+    random = np.random.RandomState(random_state)
+    elements = np.arange(1, players_per_team * number_of_teams + 1)
+    quality = random.gamma(2, 0.5, len(elements))
+    return pd.DataFrame({'element': elements, 'first_name': ['First{}'.format(element) for element in elements],
+                         'second_name': ['Last{}'.format(element) for element in elements],
+                         'team': (elements - 1) // players_per_team,
+                         'element_type': random.choice(list(position_shares), len(elements),
+                                                       p=list(position_shares.values())), 'quality': quality,
+                         'value': np.clip(np.round(40 + 12 * quality + random.normal(0, 4, len(elements))), 40,
+                                          130).astype(int)})
+
+
+def synthetic_season(season, players, rounds=38):
+    """
+    Makes the raw gameweeks, positions and bookies odds of a season in the same formats as the downloaded files, with
+    a row in the gameweeks for every player of both teams in every fixture, whether they played or not. The best
+    player of each team plays every fixture.
+
+    :param season: The season, e.g. '2020-21'.
+    :param players: The players from synthetic_players.
+    :param rounds: The number of rounds that have been played.
+    :return: (gameweeks_df, positions_df, odds_df)
+    """
+    random = np.random.RandomState(int(season[:4]))
+    teams = synthetic_teams()
+    schedule = synthetic_schedule(season)
+    schedule = schedule[schedule['round'] <= rounds]
+    schedule['home_goals'] = random.poisson(1.5, len(schedule))
+    schedule['away_goals'] = random.poisson(1.2, len(schedule))
+
+    home = schedule.merge(players, left_on='home', right_on='team').assign(was_home=True)
+    away = schedule.merge(players, left_on='away', right_on='team').assign(was_home=False)
+    gameweeks_df = pd.concat([home, away], ignore_index=True)
+    was_home = gameweeks_df['was_home'].to_numpy()
+    size = len(gameweeks_df)
+
+    quality = gameweeks_df['quality'].to_numpy()
+    # the best player of each team always plays, so both teams of every fixture have an appearance, however few
+    # players there are in a team
+    best = gameweeks_df.groupby(['fixture', 'was_home'])['quality'].transform('max').to_numpy() == quality
+    played = best | (random.random_sample(size) < np.clip(0.2 + 0.27 * quality, 0.05, 0.95))
+    minutes = np.where(played, random.randint(1, 91, size), 0)
+    share = minutes / 90
+    element_type = gameweeks_df['element_type'].to_numpy()
+    goals_scored = random.poisson(np.vectorize(goal_rates.get)(element_type) * quality * share)
+    assists = random.poisson(0.1 * quality * share)
+    conceded = np.where(was_home, gameweeks_df['away_goals'], gameweeks_df['home_goals'])
+    goals_conceded = np.where(minutes >= 60, conceded, 0)
+    clean_sheets = ((minutes >= 60) & (conceded == 0)).astype(int)
+    yellow_cards = random.poisson(0.1 * share).clip(0, 1)
+    red_cards = random.poisson(0.005 * share).clip(0, 1)
+
+    gameweeks_df = pd.DataFrame({
+        'name': ['{}_{}_{}'.format(first, second, element) for first, second, element in
+                 zip(gameweeks_df['first_name'], gameweeks_df['second_name'], gameweeks_df['element'])],
+        'assists': assists, 'bps': np.where(played, random.randint(-3, 40, size), 0), 'clean_sheets': clean_sheets,
+        'creativity': np.round(random.gamma(1, 8, size) * quality * share, 1), 'element': gameweeks_df['element'],
+        'fixture': gameweeks_df['fixture'], 'goals_conceded': goals_conceded, 'goals_scored': goals_scored,
+        'influence': np.round(random.gamma(1.5, 10, size) * quality * share, 1),
+        'kickoff_time': gameweeks_df['kickoff_time'],
+        'minutes': minutes, 'opponent_team': np.where(was_home, gameweeks_df['away'], gameweeks_df['home']) + 1,
+        'own_goals': random.poisson(0.005 * share), 'penalties_missed': random.poisson(0.005 * share),
+        'penalties_saved': np.where(element_type == 1, random.poisson(0.02 * share), 0),
+        'red_cards': red_cards, 'round': gameweeks_df['round'],
+        'saves': np.where(element_type == 1, random.poisson(2.5 * share), 0),
+        'team_a_score': gameweeks_df['away_goals'], 'team_h_score': gameweeks_df['home_goals'],
+        'threat': np.round(random.gamma(1, 10, size) * quality * share, 1),
+        'total_points': (played.astype(int) + (minutes >= 60) + 3 * assists - yellow_cards - 3 * red_cards +
+                         goals_scored * np.vectorize(goal_points.get)(element_type) +
+                         clean_sheets * np.vectorize(clean_sheet_points.get)(element_type)),
+        'value': gameweeks_df['value'], 'was_home': was_home, 'yellow_cards': yellow_cards,
+        'GW': gameweeks_df['round']})
+
+    result = np.sign(schedule['home_goals'] - schedule['away_goals'])
+    home_odds = np.round(random.uniform(1.2, 8, len(schedule)), 2)
+    odds_df = pd.DataFrame({'Div': 'E0', 'Date': pd.to_datetime(schedule['kickoff_time']).dt.strftime('%d/%m/%Y'),
+                            'HomeTeam': [teams[team] for team in schedule['home']],
+                            'AwayTeam': [teams[team] for team in schedule['away']],
+                            'FTHG': schedule['home_goals'], 'FTAG': schedule['away_goals'],
+                            'FTR': result.map({1: 'H', 0: 'D', -1: 'A'}), 'B365H': home_odds,
+                            'B365A': np.round(1 / np.clip(0.95 - 1 / home_odds, 0.05, None), 2)})
+
+    positions_df = players[['first_name', 'second_name', 'element_type']].copy()
+    return gameweeks_df, positions_df, odds_df
+
+
+def synthetic_next_odds(next_round, cache_directory=None, season='2020-21'):
+    """
+    Gets the fixtures and odds of a synthetic round, in the same format as the fixture sources.
+
+    :param next_round: The round to get the fixtures of.
+    :param cache_directory: Not used.
+    :param season: The synthetic season of the round.
+    :return: The next odds dataframe.
+    """
+    random = np.random.RandomState(next_round)
+    teams = synthetic_teams()
+    schedule = synthetic_schedule(season)
+    schedule = schedule[schedule['round'] == next_round]
+    kickoff_time = pd.to_datetime(schedule['kickoff_time'])
+    home_odds = np.round(random.uniform(1.2, 8, len(schedule)), 2)
+    return pd.DataFrame({'shift_date_of_match': kickoff_time.dt.strftime('%Y-%m-%d'),
+                         'shift_time_of_match': (kickoff_time + timedelta(hours=1)).dt.strftime('%H:%M'),
+                         'shift_home_team': [teams[team] for team in schedule['home']], 'B365H': home_odds,
+                         'shift_away_team': [teams[team] for team in schedule['away']],
+                         'B365A': np.round(1 / np.clip(0.95 - 1 / home_odds, 0.05, None), 2)})
+
+
+def synthetic_history(number_of_seasons, players_per_team=30, played_rounds=30):
+    """
+    Makes the raw data of a number of seasons, up to the current 2020-21 season.
+
+    :param number_of_seasons: The number of seasons, from 1 for only the current season.
+    :param players_per_team: The number of players in each team.
+    :param played_rounds: The number of rounds played in the current season.
+    :return: Dictionary of season: (gameweeks_df, positions_df, odds_df), the oldest season first.
+    """
+    players = synthetic_players(players_per_team)
+    seasons = ['{}-{:02d}'.format(year, (year + 1) % 100) for year in range(2021 - number_of_seasons, 2021)]
+    return {season: synthetic_season(season, players, played_rounds if season == '2020-21' else 38)
+            for season in seasons}
+
+
+def train_synthetic_model(path, max_rows=20000):
+    """
+    Fits a quick model and feature pipeline on the synthetic all_gameweeks, the same way as modeling_preperation, so
+    the predictions can be timed. The model is not meant to be any good.
+
+    :param path: The synthetic project directory.
+    :param max_rows: The most observations to fit on.
+    """
+    gameweeks = gws.load_gameweeks(path=path).drop(['round', 'date_of_match'], axis=1)
+    predictors = gameweeks[gameweeks['shift_points_range'].notna()]
+    predictors = predictors.sample(min(max_rows, len(predictors)), random_state=1)
+    labels = predictors.pop('shift_points_range')
+    numerical = [column for column in predictors.columns if column not in categorical]
+    x_train, _, y_train, _, transformer = mf.split_and_scale(predictors, labels, MinMaxScaler(), numerical,
+                                                             categorical)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        model = LogisticRegression(max_iter=200).fit(x_train, y_train)
+    with open(path + 'best_model.sav', 'wb') as file:
+        pickle.dump(model, file)
+    mf.save_feature_pipeline(path + 'feature_pipeline.sav', transformer)
+
+
+def time_call(function, *args, **kwargs):
+    """
+    :return: The seconds the function call took.
+    """
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def benchmark_history(number_of_seasons, rows_to_check=(10, 20, 30), players_per_team=30, repeat=3):
+    """
+    Runs the weekly pipeline on a synthetic history in a temporary project directory, from cleaning the raw seasons to
+    the best squad, and times each step.
+
+    :param number_of_seasons: The number of seasons of history.
+    :param rows_to_check: The rows_to_check to time the combinations best squad at. The MILP best squad is timed once.
+    :param players_per_team: The number of players in each team.
+    :param repeat: The number of times to run each step.
+    :return: (size, timings), where size is a dictionary of the number of rows of each dataset and timings is a
+             dictionary of (benchmark, rows_to_check): list of the seconds of each run.
+    """
+    history = synthetic_history(number_of_seasons, players_per_team)
+    path = tempfile.mkdtemp(prefix='pipeline_benchmarks_') + '/'
+    os.makedirs(path + 'CSV/clean_season_data')
+    os.makedirs(path + 'CSV/predictions')
+    for directory in ['raw_gameweek_data', 'raw_full_season_data', 'bookies_odds']:
+        os.makedirs(path + 'CSV/' + directory)
+    for season, (gameweeks_df, positions_df, odds_df) in history.items():
+        gameweeks_df.to_csv(path + 'CSV/raw_gameweek_data/gameweeks-{}.csv'.format(season), index=False)
+        positions_df.to_csv(path + 'CSV/raw_full_season_data/season-{}.csv'.format(season), index=False)
+        odds_df.to_csv(path + 'CSV/bookies_odds/odds-{}.csv'.format(season), index=False)
+    timings = {}
+
+    def add(benchmark, seconds, rows_checked=None):
+        timings.setdefault((benchmark, rows_checked), []).append(seconds)
+
+    try:
+        for run in range(repeat):
+            trace = PipelineTrace()
+            with trace.functions(dcf, 'dcf'):
+                start = time.perf_counter()
+                for season, (gameweeks_df, positions_df, odds_df) in history.items():
+                    clean_season(season, gameweeks_df, positions_df, odds_df).to_csv(
+                        path + 'CSV/clean_season_data/clean-{}.csv'.format(season), index=False)
+                add('clean_seasons', time.perf_counter() - start)
+
+                add('season_concatenator', time_call(season_concatenator, path=path))
+                add('get_next_fixtures', time_call(get_next_fixtures, source=synthetic_next_odds, path=path))
+            dcf_calls = trace.summary()
+            for name, seconds in zip(dcf_calls['name'], dcf_calls['wall_seconds']):
+                add(name, seconds)
+
+            # the same seasons read from their raw CSVs and cleaned across a process pool, one season in each process
+            add('clean_seasons_parallel', time_call(clean_finished_seasons, list(history), path=path))
+
+            if run == 0:
+                train_synthetic_model(path)
+            add('get_predictions', time_call(get_predictions, path=path))
+
+            add('get_best_squad', time_call(get_best_squad, 'all', method='milp', path=path))
+            for rows_checked in rows_to_check:
+                add('get_best_squad', time_call(get_best_squad, 'all', rows_checked, 'combinations', path=path),
+                    rows_checked)
+
+        size = {'seasons': number_of_seasons, 'raw_rows': sum(len(season[0]) for season in history.values()),
+                'clean_rows': len(gws.load_gameweeks(columns=['season'], path=path)),
+                'next_fixture_rows': len(pd.read_csv(path + 'CSV/predictions/next_fixtures.csv'))}
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return size, timings
+
+
+def current_commit():
+    """
+    :return: The hash of the checked out git commit, with '+' on the end if there are uncommitted changes, or None if
+             it can't be found.
+    """
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changed = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+' if changed else '')
+
+
+def run_benchmarks(seasons=(1, 2, 5, 10), rows_to_check=(10, 20, 30), players_per_team=30, repeat=3,
+                   output=None):
+    """
+    Benchmarks the cleaning pipeline and squad optimizer on synthetic histories of several sizes, and saves the
+    results as JSON so they can be compared between commits with compare_benchmarks.
+
+    :param seasons: The numbers of seasons of history to benchmark.
+    :param rows_to_check: The rows_to_check to time the combinations best squad at.
+    :param players_per_team: The number of players in each team. About 30 gives the number of observations of a real
+                             season.
+    :param repeat: The number of times to run each step at each size.
+    :param output: The path to save the results to. Default is None, which saves them in the projects benchmarks
+                   directory named after the commit.
+    :return: The results dictionary, with the 'commit', 'parameters', the 'sizes' and a row of 'results' for each
+             benchmark at each size, with the seconds of each run and their 'min' and 'median'.
+    """
+    results = {'commit': current_commit(), 'created': datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+               'parameters': {'seasons': list(seasons), 'rows_to_check': list(rows_to_check),
+                              'players_per_team': players_per_team, 'repeat': repeat},
+               'sizes': [], 'results': []}
+    for number_of_seasons in seasons:
+        size, timings = benchmark_history(number_of_seasons, rows_to_check, players_per_team, repeat)
+        results['sizes'].append(size)
+        for (benchmark, rows_checked), seconds in timings.items():
+            results['results'].append({'benchmark': benchmark, 'seasons': number_of_seasons,
+                                       'rows': size['clean_rows'], 'rows_to_check': rows_checked,
+                                       'seconds': seconds, 'min': min(seconds), 'median': float(np.median(seconds))})
+
+    if output is None:
+        path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+        output = path + 'benchmarks/pipeline-{}.json'.format((results['commit'] or 'unknown')[:12])
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=4)
+    return results
+
+
+def compare_benchmarks(baseline_path, new_path, tolerance=0.1, min_seconds=0.005):
+    """
+    Compares the median seconds of each benchmark between two runs of run_benchmarks.
+
+    :param baseline_path: The path to the results to compare against.
+    :param new_path: The path to the new results.
+    :param tolerance: The fraction slower a benchmark can get before it counts as a regression.
+    :param min_seconds: The fewest seconds slower a benchmark must get to count as a regression, so the noise in the
+                        quickest functions is not flagged.
+    :return: Dataframe of each benchmark in both runs, with the 'baseline' and 'new' median seconds, the 'change' as a
+             fraction of the baseline and whether it is a 'regression', the biggest change first.
+    """
+    keys = ['benchmark', 'seasons', 'rows_to_check']
+    runs = []
+    for file_path, column in ((baseline_path, 'baseline'), (new_path, 'new')):
+        with open(file_path) as file:
+            run = pd.DataFrame(json.load(file)['results'])
+        runs.append(run[keys + ['median']].rename(columns={'median': column}).fillna({'rows_to_check': -1}))
+    comparison = runs[0].merge(runs[1], on=keys)
+    comparison['rows_to_check'] = comparison['rows_to_check'].replace(-1, np.nan)
+    comparison['change'] = comparison['new'] / comparison['baseline'] - 1
+    comparison['regression'] = (comparison['change'] > tolerance) & \
+                               (comparison['new'] - comparison['baseline'] > min_seconds)
+    return comparison.sort_values(by='change', ascending=False).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the cleaning pipeline and squad optimizer on synthetic '
+                                                 'data, or compare two benchmark results.')
+    parser.add_argument('--seasons', type=int, nargs='+', default=[1, 2, 5, 10])
+    parser.add_argument('--rows-to-check', type=int, nargs='+', default=[10, 20, 30])
+    parser.add_argument('--players-per-team', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'NEW'))
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+            print(compare_benchmarks(*arguments.compare, arguments.tolerance))
+    else:
+        benchmark_results = run_benchmarks(arguments.seasons, arguments.rows_to_check, arguments.players_per_team,
+                                           arguments.repeat, arguments.output)
+        summary = pd.DataFrame(benchmark_results['results'])
+        summary['rows_to_check'] = [str(int(rows)) if pd.notnull(rows) else '-' for rows in summary['rows_to_check']]
+        summary = summary.pivot_table(index=['benchmark', 'rows_to_check'], columns='seasons', values='median')
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+            print(summary.round(4))
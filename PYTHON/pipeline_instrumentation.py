@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from PYTHON.process_stats import peak_rss_mb
+
+
+def rows_of(value):
+    """
+    Gets the number of rows of a dataframe or series.
+
+    :param value: Any value.
+    :return: The number of rows, or None if the value is not a dataframe or series.
+    """
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+
+class PipelineTrace:
+    """
+    Records the wall time, CPU time, peak memory and rows of each stage of a pipeline run and of each function call
+    inside them, so they can be saved as a Chrome trace and summarised. A disabled trace records nothing, so the
+    pipeline can always be run inside one.
+
+    The CPU time is of the whole process, so it includes any other threads running at the same time. The peak RSS is
+    the high water mark of the process at the end of the stage, and the RSS increase is how much the stage raised it,
+    which is only more than 0 for the stage that pushed the peak up.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def stage(self, name, category='stage'):
+        """
+        Records a stage. Nested stages, including the function calls, are recorded inside it.
+
+        :param name: The name of the stage.
+        :param category: The category of the stage in the trace.
+        :return: Dictionary of the stages arguments in the trace, where the 'rows' it processed can be set. Default is
+                 the most rows of any call inside it.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'args': {}}
+        self.local.stack.append(event)
+        start_peak = peak_rss_mb()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield event['args']
+        except BaseException as error:
+            event['args']['error'] = '{}: {}'.format(type(error).__name__, error)
+            raise
+        finally:
+            end_wall, end_cpu = time.perf_counter(), time.process_time()
+            self.local.stack.pop()
+            end_peak = peak_rss_mb()
+
+            args = event['args']
+            inner_rows = args.pop('inner_rows', None)
+            if args.get('rows') is None and inner_rows is not None:
+                args['rows'] = inner_rows
+            if args.get('rows') is None:
+                args.pop('rows', None)
+            elif self.local.stack:
+                parent = self.local.stack[-1]['args']
+                parent['inner_rows'] = max(parent.get('inner_rows', 0), args['rows'])
+            args.update(wall_seconds=end_wall - start_wall, cpu_seconds=end_cpu - start_cpu, peak_rss_mb=end_peak,
+                        rss_increase_mb=end_peak - start_peak)
+
+            event.update(ts=(start_wall - self.origin) * 1e6, dur=(end_wall - start_wall) * 1e6)
+            with self.lock:
+                self.events.append(event)
+
+    @contextmanager
+    def functions(self, module, prefix=None):
+        """
+        Records every call of a modules functions while inside the context. The rows of a call are the rows of the
+        dataframe it returns, or of the first dataframe passed to it for the functions that change a dataframe in
+        place.
+
+        :param module: The module whose functions to record, e.g. data_cleaning_functions.
+        :param prefix: The prefix of each calls name. Default is None, which uses the last part of the modules name.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        prefix = prefix or module.__name__.split('.')[-1]
+        originals = {name: function for name, function in vars(module).items()
+                     if inspect.isfunction(function) and function.__module__ == module.__name__}
+
+        def traced(name, function):
+            @functools.wraps(function)
+            def traced_function(*args, **kwargs):
+                with self.stage('{}.{}'.format(prefix, name), prefix) as record:
+                    result = function(*args, **kwargs)
+                    rows = [rows_of(value) for value in (result, ) + args + tuple(kwargs.values())]
+                    record['rows'] = next((row for row in rows if row is not None), None)
+                    return result
+            return traced_function
+
+        for name, function in originals.items():
+            setattr(module, name, traced(name, function))
+        try:
+            yield
+        finally:
+            for name, function in originals.items():
+                setattr(module, name, function)
+
+    def summary(self):
+        """
+        Summarises the recorded stages in the order they started, followed by the function calls, the slowest first.
+
+        :return: Dataframe with the number of 'calls' and the total 'wall_seconds' and 'cpu_seconds' of each stage and
+                 function, and the most 'rows', 'peak_rss_mb' and 'rss_increase_mb' of any call.
+        """
+        columns = ['category', 'name', 'calls', 'wall_seconds', 'cpu_seconds', 'rows', 'peak_rss_mb', 'rss_increase_mb']
+        if not self.events:
+            return pd.DataFrame(columns=columns)
+        events = pd.DataFrame([{'category': event['cat'], 'name': event['name'], 'ts': event['ts'], 'rows': None,
+                                **event['args']} for event in self.events])
+        summary = events.groupby(['category', 'name'], sort=False).agg(
+            calls=('name', 'size'), wall_seconds=('wall_seconds', 'sum'), cpu_seconds=('cpu_seconds', 'sum'),
+            rows=('rows', 'max'), peak_rss_mb=('peak_rss_mb', 'max'), rss_increase_mb=('rss_increase_mb', 'max'),
+            start=('ts', 'min')).reset_index()
+        is_stage = summary['category'] == 'stage'
+        summary = pd.concat([summary[is_stage].sort_values(by='start'),
+                             summary[~is_stage].sort_values(by='wall_seconds', ascending=False)])
+        summary['rows'] = summary['rows'].astype('Int64')
+        return summary[columns].reset_index(drop=True)
+
+    def save(self, file_path):
+        """
+        Saves the recorded stages as a Chrome trace, which can be opened in chrome://tracing or ui.perfetto.dev, with
+        the summary table in its 'otherData'. It is written to a temporary file first and then moved into place.
+
+        :param file_path: The path to save the trace to.
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event['ts'])
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms',
+                 'otherData': {'summary': json.loads(self.summary().to_json(orient='records'))}}
+        with open(file_path + '.tmp', 'w') as file:
+            json.dump(trace, file)
+        os.replace(file_path + '.tmp', file_path)
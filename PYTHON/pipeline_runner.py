@@ -0,0 +1,271 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+import pandas as pd
+from fnmatch import fnmatch
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import PYTHON.fixture_sources as fs
+from PYTHON.data_collection import get_data, file_hash
+from PYTHON.current_season_cleaner import current_season_cleaner
+from PYTHON.season_concatenator import season_concatenator
+from PYTHON.getting_next_fixtures import get_next_fixtures
+from PYTHON.predicting_next_fixtures import get_predictions
+from PYTHON.best_predicted_squad import get_best_squads
+from PYTHON.pipeline_instrumentation import PipelineTrace, rows_of
+
+raw_gameweeks = 'CSV/raw_gameweek_data/gameweeks-2020-21.csv'
+raw_odds = 'CSV/bookies_odds/odds-2020-21.csv'
+next_odds_file = 'CSV/predictions/next_odds.csv'
+best_squad_constraints = ['budget', 'team', 'all', 'none']
+
+
+def run_get_data(path, results):
+    """
+    Downloads the current season data sources that have changed.
+    """
+    get_data(path=path + 'CSV/')
+
+
+def run_current_season_cleaner(path, results):
+    """
+    Cleans the new fixtures of the current season, returning the changes for season_concatenator.
+    """
+    return current_season_cleaner(incremental=True, path=path)
+
+
+def run_season_concatenator(path, results):
+    """
+    Concatenates the clean seasons into all_gameweeks.
+    """
+    # the changes are only there if the cleaner ran in this run, otherwise every season is concatenated
+    season_concatenator(changes=results.get('current_season_cleaner'), path=path)
+
+
+def run_get_next_odds(path, results):
+    """
+    Fetches the fixtures and odds of the round after the last round in the raw gameweeks and saves them.
+    """
+    next_round = pd.read_csv(path + raw_gameweeks, usecols=['round'])['round'].max() + 1
+    next_odds = fs.get_next_odds([next_round], 'http', path + 'CSV/fixture_cache/')[next_round]
+    next_odds[fs.next_odds_columns].assign(round=next_round).to_csv(path + next_odds_file, index=False)
+
+
+def saved_next_odds(path):
+    """
+    A fixture source that reads the next odds saved by the get_next_odds stage, so the fixtures and odds can be fetched
+    while the seasons are still being concatenated.
+
+    :param path: The project directory.
+    :return: Function of (next_round, cache_directory) -> next odds dataframe, see fixture_sources.
+    """
+    def source(next_round, cache_directory=None):
+        next_odds = pd.read_csv(path + next_odds_file)
+        if not (next_odds['round'] == next_round).all():
+            raise ValueError('The saved next odds are not for round {}, run the get_next_odds stage again.'.format(
+                next_round))
+        return next_odds[fs.next_odds_columns]
+    return source
+
+
+def run_get_next_fixtures(path, results):
+    """
+    Builds the next fixtures from all_gameweeks and the saved next odds.
+    """
+    get_next_fixtures(source=saved_next_odds(path), path=path)
+
+
+def run_get_predictions(path, results):
+    """
+    Predicts the next fixtures.
+    """
+    get_predictions(path=path)
+
+
+def run_best_squads(path, results):
+    """
+    Solves the best squad of every constraint, sharing the predictions and candidate squads between them.
+    """
+    get_best_squads(best_squad_constraints, path=path)
+
+
+# every stage of the weekly pipeline, with the files it reads and writes as glob patterns relative to the project
+# directory. A stage runs after every stage whose outputs it reads, and is skipped if the contents of its inputs are
+# the same as the last time it finished and its outputs are still there. The always_run stages fetch remote data, so
+# they run every time, but the stages after them are still skipped if what they fetched has not changed.
+weekly_stages = {
+    'get_data': {'function': run_get_data, 'inputs': [], 'outputs': [raw_gameweeks, raw_odds], 'always_run': True},
+    'current_season_cleaner': {'function': run_current_season_cleaner, 'inputs': [raw_gameweeks, raw_odds],
+                               'outputs': ['CSV/clean_season_data/clean-2020-21.csv']},
+    'get_next_odds': {'function': run_get_next_odds, 'inputs': [raw_gameweeks], 'outputs': [next_odds_file],
+                      'always_run': True},
+    'season_concatenator': {'function': run_season_concatenator, 'inputs': ['CSV/clean_season_data/*.csv'],
+                            'outputs': ['CSV/all_gameweeks/*.parquet']},
+    'get_next_fixtures': {'function': run_get_next_fixtures, 'inputs': ['CSV/all_gameweeks/*.parquet', next_odds_file],
+                          'outputs': ['CSV/predictions/next_fixtures.csv']},
+    'get_predictions': {'function': run_get_predictions,
+                        'inputs': ['CSV/predictions/next_fixtures.csv', 'best_model.sav', 'feature_pipeline.sav'],
+                        'outputs': ['CSV/predictions/predictions.csv']},
+    'best_squads': {'function': run_best_squads,
+                    'inputs': ['CSV/predictions/predictions.csv', 'CSV/predictions/next_fixtures.csv'],
+                    'outputs': ['CSV/predictions/*/best_squad_{}.csv'.format(constraint)
+                                for constraint in best_squad_constraints]}
+}
+
+
+def stage_dependencies(stages):
+    """
+    Works out which stages each stage has to run after, from the stages whose outputs match its inputs.
+
+    :param stages: Dictionary of stage name to its 'function', 'inputs' and 'outputs', like weekly_stages.
+    :return: Dictionary of stage name to the set of stages it depends on.
+    """
+    dependencies = {name: {other for other, other_stage in stages.items() if other != name and any(
+        fnmatch(output, pattern) or fnmatch(pattern, output)
+        for output in other_stage['outputs'] for pattern in stage['inputs'])} for name, stage in stages.items()}
+
+    # a stage that can never be ready is part of a cycle
+    ordered = set()
+    while len(ordered) < len(stages):
+        ready = {name for name in stages if name not in ordered and dependencies[name] <= ordered}
+        if not ready:
+            raise ValueError('The stages have a dependency cycle: {}'.format(sorted(set(stages) - ordered)))
+        ordered |= ready
+    return dependencies
+
+
+def load_state(state_path):
+    """
+    Loads the input hash of each stage from the last time it finished, and the cached hashes of the files.
+
+    :param state_path: The path to the JSON state file.
+    :return: Dictionary with the 'stages' and 'files', which are empty if the pipeline has not been run yet.
+    """
+    if not os.path.exists(state_path):
+        return {'stages': {}, 'files': {}}
+    with open(state_path) as file:
+        return json.load(file)
+
+
+def save_state(state, state_path):
+    """
+    Saves the pipeline state, writing to a temporary file first and then moving it into place.
+
+    :param state: Dictionary with the 'stages' and 'files'.
+    :param state_path: The path to the JSON state file.
+    """
+    with open(state_path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(state_path + '.tmp', state_path)
+
+
+def matching_files(patterns, path):
+    """
+    Gets the files that match the patterns.
+
+    :param patterns: Iterable of glob patterns relative to the project directory.
+    :param path: The project directory.
+    :return: Sorted list of the matching files relative to the project directory.
+    """
+    return sorted({os.path.relpath(file, path) for pattern in patterns for file in glob.glob(path + pattern)})
+
+
+def inputs_hash(stage, path, file_hashes, lock):
+    """
+    Hashes the contents of every input of a stage together with their names. The hash of a file is reused while its
+    size and modification time are the same, so unchanged files are not read again.
+
+    :param stage: The stage dictionary.
+    :param path: The project directory.
+    :param file_hashes: Dictionary of file to its 'size', 'mtime' and 'sha256', which is updated with the new hashes.
+    :param lock: The lock to hold while updating file_hashes.
+    :return: The hex digest of the inputs.
+    """
+    digest = hashlib.sha256()
+    for file in matching_files(stage['inputs'], path):
+        status = os.stat(path + file)
+        with lock:
+            cached = file_hashes.get(file)
+        if cached is None or cached['size'] != status.st_size or cached['mtime'] != status.st_mtime_ns:
+            cached = {'size': status.st_size, 'mtime': status.st_mtime_ns, 'sha256': file_hash(path + file)}
+            with lock:
+                file_hashes[file] = cached
+        digest.update('{}\0{}\0'.format(file, cached['sha256']).encode())
+    return digest.hexdigest()
+
+
+def run_pipeline(stages=None, path=None, workers=4, force=(), trace=None):
+    """
+    Runs the stages of a pipeline in the order of their dependencies, running the stages that do not depend on each
+    other at the same time. A stage is skipped if the hash of its inputs is the same as the last time it finished and
+    its outputs are still there, so re-running after a failure only redoes the stages from the one that failed. A
+    stage that fails stops the stages after it, but the other stages still run and their progress is saved.
+
+    :param stages: Dictionary of stage name to its 'function' of (path, results), 'inputs', 'outputs' and whether it
+                   is 'always_run'. The results are the return values of the stages that ran before it. Default is
+                   None, which runs weekly_stages.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    :param workers: The number of stages to run at once.
+    :param force: Iterable of stage names to run even if their inputs have not changed.
+    :param trace: A PipelineTrace to record each stage in. Default is None, which records nothing.
+    :return: Dictionary of stage name to whether it 'ran', was 'skipped', 'failed' or was 'blocked' by a failed stage.
+    """
+    stages = stages or weekly_stages
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    trace = trace or PipelineTrace(enabled=False)
+    unknown = set(force) - set(stages)
+    if unknown:
+        raise ValueError('Stages to force are not in the pipeline: {}'.format(sorted(unknown)))
+
+    dependencies = stage_dependencies(stages)
+    state_path = path + 'CSV/pipeline_state.json'
+    state = load_state(state_path)
+    lock = threading.Lock()
+    results, statuses, errors = {}, {}, {}
+
+    def run_stage(name):
+        stage = stages[name]
+        hashed = inputs_hash(stage, path, state['files'], lock)
+        outputs_exist = all(matching_files([pattern], path) for pattern in stage['outputs'])
+        if (not stage.get('always_run') and name not in force and outputs_exist and
+                state['stages'].get(name, {}).get('inputs') == hashed):
+            return 'skipped', None, hashed
+        with trace.stage(name) as record:
+            result = stage['function'](path, results)
+            record['rows'] = rows_of(result)
+        return 'ran', result, hashed
+
+    with ThreadPoolExecutor(workers) as executor:
+        running = {}
+        while len(statuses) < len(stages):
+            for name in stages:
+                if name in statuses or name in running.values() or not dependencies[name] <= set(statuses):
+                    continue
+                if any(statuses[dependency] in {'failed', 'blocked'} for dependency in dependencies[name]):
+                    statuses[name] = 'blocked'
+                else:
+                    running[executor.submit(run_stage, name)] = name
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    statuses[name], result, hashed = future.result()
+                except Exception as error:
+                    statuses[name], errors[name] = 'failed', error
+                    # forget the last run, so the stage is not skipped next time because of its old outputs
+                    state['stages'].pop(name, None)
+                if statuses[name] == 'ran':
+                    results[name] = result
+                    state['stages'][name] = {'inputs': hashed, 'finished': datetime.now().isoformat()}
+                with lock:
+                    save_state(state, state_path)
+
+    if errors:
+        raise RuntimeError('Pipeline stages failed: {}, statuses: {}'.format(sorted(errors), statuses)) from \
+            next(iter(errors.values()))
+    return statuses
@@ -1,29 +1,46 @@
 import pandas as pd
 import pickle
-import PYTHON.data_cleaning_functions as dcf
-from PYTHON.modeling_preperation import categorical, predictors_dummified, transformer
+import PYTHON.modeling_functions as mf
 
 
-def get_predictions():
+def predict_fixtures(next_fixtures, model, feature_pipeline):
+    """
+    Predicts the points range of every player in the fixtures.
 
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    :param next_fixtures: The next fixtures dataframe.
+    :param model: The fitted model.
+    :param feature_pipeline: The feature pipeline from load_feature_pipeline.
+    :return: The predictions dataframe, with each players name, value, position, team, shifted opponent, predicted
+             point range and the probability of each point range.
+    """
+    X_ready = mf.transform_features(next_fixtures.drop(['round', 'date_of_match'], axis=1, errors='ignore'),
+                                    feature_pipeline)
 
-    next_fixtures = pd.read_csv(path + 'CSV/predictions/next_fixtures.csv')
+    predictions = next_fixtures[['name', 'value', 'position', 'plays_for', 'shift_opponent']].copy()
+    predictions['predicted_point_range'] = model.predict(X_ready)
+    predictions[['prob_0', 'prob_1', 'prob_2', 'prob_3']] = model.predict_proba(X_ready)
 
-    next_fixtures.drop(['round', 'date_of_match'], axis=1, inplace=True)
+    predictions['position'].replace({'AttDEF': 'DEF', 'DefDEF': 'DEF'}, inplace=True)
 
-    model = pickle.load(open(path + 'best_model.sav', 'rb'))
+    return predictions
 
-    X_dum = pd.get_dummies(next_fixtures, columns=categorical)
 
-    X_fixed = dcf.fix_columns(X_dum, predictors_dummified.columns)
+def get_predictions(path=None):
+    """
+    Predicts the points range of every player in the next fixtures with the saved model and feature pipeline, and saves
+    them as predictions.
 
-    X_ready = transformer.transform(X_fixed)
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
 
-    predictions = next_fixtures[['name', 'value', 'position', 'plays_for', 'shift_opponent']].copy()
-    predictions['predicted_point_range'] = model.predict(X_ready)
-    predictions[['prob_0', 'prob_1', 'prob_2', 'prob_3']] = model.predict_proba(X_ready)
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
 
-    predictions['position'].replace({'AttDEF': 'DEF', 'DefDEF': 'DEF'}, inplace=True)
+    next_fixtures = pd.read_csv(path + 'CSV/predictions/next_fixtures.csv')
+
+    model = pickle.load(open(path + 'best_model.sav', 'rb'))
+
+    feature_pipeline = mf.load_feature_pipeline(path + 'feature_pipeline.sav')
+
+    predictions = predict_fixtures(next_fixtures, model, feature_pipeline)
 
     predictions.to_csv(path + 'CSV/predictions/predictions.csv', index=False)
@@ -0,0 +1,279 @@
+import os
+import json
+import pickle
+import argparse
+import threading
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import PYTHON.modeling_functions as mf
+import PYTHON.best_predicted_squad as bps
+from PYTHON.predicting_next_fixtures import predict_fixtures
+
+# the most squads a single best_squad request can solve
+max_squads = 50
+
+
+def artifact_paths():
+    """
+    The files the server loads, and reloads whenever one of them changes.
+
+    :return: Dictionary of the name of each artifact to its path.
+    """
+    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    return {'model': path + 'best_model.sav', 'feature_pipeline': path + 'feature_pipeline.sav',
+            'next_fixtures': path + 'CSV/predictions/next_fixtures.csv',
+            'players': path + 'CSV/raw_gameweek_data/gameweeks-2020-21.csv'}
+
+
+def current_players(gameweeks_df):
+    """
+    Gets every player in the latest round of the raw gameweeks, so squads can include players without a prediction.
+
+    :param gameweeks_df: The raw current season gameweeks dataframe.
+    :return: Dataframe of each players name, value, position and team.
+    """
+    players = gameweeks_df[gameweeks_df['round'] == max(gameweeks_df['round'])]
+    players = players[['name', 'value', 'position', 'team']].drop_duplicates(subset=['name'])
+    players = players.rename(columns={'team': 'plays_for'})
+    players['plays_for'] = players['plays_for'].replace({"Sheffield Utd": "Sheffield United", "Spurs": "Tottenham",
+                                                         "Man Utd": "Man United"})
+    return players
+
+
+def records(dataframe):
+    """
+    Turns a dataframe into JSON ready records, with missing values as None.
+
+    :param dataframe: The dataframe to turn into records.
+    :return: List of dictionaries, one for each row.
+    """
+    return json.loads(dataframe.to_json(orient='records'))
+
+
+class PredictionState:
+    """
+    The model, feature pipeline, next fixtures, predictions and players, loaded once and kept warm between requests.
+    They are all reloaded together as soon as any of their files is changed, and the solved squads are cached until
+    then. The reloaded artifacts are built before they replace the old ones, so each request answers from one set of
+    artifacts even while they are being reloaded.
+    """
+
+    def __init__(self, paths=None):
+        self.paths = paths or artifact_paths()
+        # the refresh lock stops two requests reloading at once, the lock guards swapping the artifacts and the cache
+        self.refresh_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.artifacts = None
+        self.refresh()
+
+    def current(self):
+        """
+        :return: Dictionary of the 'modified_times', 'model', 'feature_pipeline', 'next_fixtures', 'predictions',
+                 'players' and the 'squads' cache that were loaded together.
+        """
+        with self.lock:
+            return self.artifacts
+
+    def is_current(self, modified_times):
+        """
+        :param modified_times: Dictionary of the name of each artifact to when its file was last changed.
+        :return: Whether the loaded artifacts are from those files.
+        """
+        artifacts = self.current()
+        return artifacts is not None and artifacts['modified_times'] == modified_times
+
+    def load(self, modified_times):
+        """
+        Loads every artifact and predicts the next fixtures.
+
+        :param modified_times: Dictionary of the name of each artifact to when its file was last changed.
+        :return: The artifacts dictionary, with an empty squads cache.
+        """
+        with open(self.paths['model'], 'rb') as file:
+            model = pickle.load(file)
+        feature_pipeline = mf.load_feature_pipeline(self.paths['feature_pipeline'])
+        next_fixtures = pd.read_csv(self.paths['next_fixtures'])
+        return {'modified_times': modified_times, 'model': model, 'feature_pipeline': feature_pipeline,
+                'next_fixtures': next_fixtures, 'predictions': predict_fixtures(next_fixtures, model, feature_pipeline),
+                'players': current_players(pd.read_csv(self.paths['players'])), 'squads': {}}
+
+    def refresh(self):
+        """
+        Reloads every artifact if any of their files has changed since they were loaded.
+        """
+        modified_times = {name: os.path.getmtime(path) for name, path in self.paths.items()}
+        if self.is_current(modified_times):
+            return
+        with self.refresh_lock:
+            if self.is_current(modified_times):
+                return
+            artifacts = self.load(modified_times)
+            with self.lock:
+                self.artifacts = artifacts
+
+    def status(self, body):
+        """
+        :param body: Not used.
+        :return: When each artifact was last changed, the next round and the number of players predicted.
+        """
+        artifacts = self.current()
+        return {'loaded': {name: pd.Timestamp(time, unit='s').isoformat() for name, time in
+                           artifacts['modified_times'].items()},
+                'next_round': int(max(artifacts['next_fixtures']['round']) + 1),
+                'players': len(artifacts['predictions'])}
+
+    def predict(self, body):
+        """
+        Predicts the given fixtures, or looks up the predictions of the given players in the next fixtures.
+
+        :param body: {'fixtures': [next fixture rows]} or {'names': [player names]}. An empty body returns every
+                     prediction.
+        :return: {'predictions': [prediction rows]}
+        """
+        artifacts = self.current()
+        predictions = artifacts['predictions']
+        if 'fixtures' in body:
+            predictions = predict_fixtures(pd.DataFrame(body['fixtures']), artifacts['model'],
+                                           artifacts['feature_pipeline'])
+        elif 'names' in body:
+            predictions = predictions[predictions['name'].isin(body['names'])]
+        return {'predictions': records(predictions)}
+
+    def best_squad(self, body):
+        """
+        Solves for the best squads under a constraint, the same way as get_best_squads.
+
+        :param body: {'constraint': one of 'budget', 'team', 'all', 'none', 'number_of_squads': number from 1 to
+                     max_squads}. Default is the single best squad under the 'all' constraint.
+        :return: {'squads': [[lineup rows]]} with the starting 11, substitutes and captain of each squad.
+        """
+        constraint = body.get('constraint', 'all')
+        number_of_squads = int(body.get('number_of_squads', 1))
+        if constraint not in {'budget', 'team', 'all', 'none'}:
+            raise ValueError("Constraint variable not within required values: {'budget', 'team', 'all', 'none'}")
+        if not 1 <= number_of_squads <= max_squads:
+            raise ValueError('The number of squads must be from 1 to {}.'.format(max_squads))
+
+        artifacts = self.current()
+        key = (constraint, number_of_squads)
+        with self.lock:
+            lineups = artifacts['squads'].get(key)
+        if lineups is None:
+            predictions = artifacts['predictions']
+            squads = bps.milp_top_squads(predictions, [constraint], number_of_squads)[constraint]
+            lineups = [records(bps.squad_lineup(squad, predictions.columns).reset_index()) for squad in squads]
+            # the squads are cached with the artifacts they were solved from, so a reload can't mix them up
+            with self.lock:
+                artifacts['squads'][key] = lineups
+        return {'squads': lineups}
+
+    def transfer(self, body):
+        """
+        Finds the best squad that can be reached from a current squad with at most the given number of transfers,
+        within the budget of the current squads value plus the bank and the max 3 players per team.
+
+        :param body: {'squad': [15 player names], 'bank': money in the bank, 'transfers': number}. Default is a single
+                     transfer with nothing in the bank.
+        :return: {'out': [player rows], 'in': [player rows], 'squad': [lineup rows]}
+        """
+        artifacts = self.current()
+        predictions, players = artifacts['predictions'], artifacts['players']
+        squad = list(body.get('squad', []))
+        transfers = int(body.get('transfers', 1))
+        if len(set(squad)) != sum(bps.squad_quotas.values()):
+            raise ValueError('The squad must be 15 different players.')
+        unknown = [name for name in squad if name not in set(players['name'])]
+        if unknown:
+            raise ValueError('Players not found: {}'.format(', '.join(unknown)))
+
+        # players without a prediction are not expected to play, so they are kept in the pool with no points
+        not_predicted = players[players['name'].isin(squad) & ~players['name'].isin(predictions['name'])].assign(
+            predicted_point_range=0, prob_0=1.0, prob_1=0.0, prob_2=0.0, prob_3=0.0)
+        pool = pd.concat([predictions, not_predicted])[predictions.columns].reset_index(drop=True)
+        squad_value = players[players['name'].isin(squad)]['value'].sum()
+
+        squads = bps.milp_top_squads(pool, ['all'], 1, budget=squad_value + body.get('bank', 0),
+                                     current_squad=squad, transfers=transfers)['all']
+        if not squads:
+            raise ValueError('No squad can be reached within the constraints.')
+        new_squad = pd.DataFrame(squads[0], columns=pool.columns)
+        return {'out': records(players[players['name'].isin(set(squad) - set(new_squad['name']))]),
+                'in': records(new_squad[~new_squad['name'].isin(squad)]),
+                'squad': records(bps.squad_lineup(squads[0], pool.columns).reset_index())}
+
+
+def make_handler(state):
+    """
+    Makes the request handler for the server, answering each endpoint from the warm state.
+
+    :param state: The PredictionState to answer from.
+    :return: The BaseHTTPRequestHandler class.
+    """
+    routes = {('GET', '/status'): state.status, ('POST', '/predict'): state.predict,
+              ('POST', '/best_squad'): state.best_squad, ('POST', '/transfer'): state.transfer}
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def respond(self, code, content):
+            data = json.dumps(content).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_route(self, method):
+            route = routes.get((method, self.path))
+            if route is None:
+                return self.respond(404, {'error': 'Unknown endpoint {} {}'.format(method, self.path)})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length)) if length else {}
+                state.refresh()
+                self.respond(200, route(body))
+            except (ValueError, KeyError, TypeError) as error:
+                self.respond(400, {'error': str(error)})
+            except Exception as error:
+                self.respond(500, {'error': '{}: {}'.format(type(error).__name__, error)})
+
+        def do_GET(self):
+            self.handle_route('GET')
+
+        def do_POST(self):
+            self.handle_route('POST')
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=8000, state=None):
+    """
+    Runs the prediction server until it is interrupted. It only listens on localhost unless another host is given.
+
+    Endpoints:
+        GET /status: When each artifact was last changed, the next round and the number of players predicted.
+        POST /predict: Predictions for {'names': [...]} or for new next fixture rows {'fixtures': [...]}.
+        POST /best_squad: The best squads for {'constraint': ..., 'number_of_squads': ...}.
+        POST /transfer: The best transfers for {'squad': [...], 'bank': ..., 'transfers': ...}.
+
+    :param host: The host to listen on.
+    :param port: The port to listen on.
+    :param state: The PredictionState to answer from. Default is None, which loads it from the saved artifacts.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(state or PredictionState()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve predictions, best squads and transfers over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    arguments = parser.parse_args()
+    serve(arguments.host, arguments.port)
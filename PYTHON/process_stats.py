@@ -0,0 +1,12 @@
+import sys
+import resource
+
+
+def peak_rss_mb():
+    """
+    Gets the peak resident set size of the current process.
+
+    :return: The peak RSS in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
@@ -1,21 +1,104 @@
 import sqlite3
+import os
+import pickle
 import pandas as pd
 import glob
 import PYTHON.data_cleaning_functions as dcf
+import PYTHON.gameweeks_store as gws
 
 
-def season_concatenator():
+def season_concatenator(persist=False, changes=None, path=None):
+    """
+    Concatenates the clean seasons, adds the features that need every season and saves them as the all_gameweeks
+    dataset, with a Parquet file for each season.
 
-    path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+    If the changes from an incremental current_season_cleaner run are given, only those observations (and the ones
+    whose features they affect) are updated in the saved all_gameweeks. A full concatenation is done instead if there
+    is no checkpoint from a previous run, or the changes add a new lowest shifted points value so every range changes.
 
-    db_connection = sqlite3.connect(path + 'seasons.sqlite')
+    :param persist: Whether to persist the joined tables to the seasons SQL database for debugging. Default is False,
+                    which does every join in memory without touching the database.
+    :param changes: Dataframe of the clean observations that were added or changed, returned by an incremental
+                    current_season_cleaner run. Default is None, which concatenates every season.
+    :param path: The project directory. Default is None, which uses the projects directory.
+    """
+
+    path = path or '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
+
+    db_connection = sqlite3.connect(path + 'seasons.sqlite') if persist else None
+
+    checkpoint_path = path + 'CSV/checkpoints/all_gameweeks.pkl'
+
+    if changes is not None and os.path.exists(checkpoint_path) and gws.saved_seasons(path):
+        with open(checkpoint_path, 'rb') as file:
+            checkpoint = pickle.load(file)
+        if incremental_concatenation(changes, gws.load_gameweeks(path=path), checkpoint, path):
+            with open(checkpoint_path, 'wb') as file:
+                pickle.dump(checkpoint, file)
+            return
 
     gameweeks_df = pd.concat(map(pd.read_csv, glob.glob(path + "CSV/clean_season_data/*.csv")))
 
     gameweeks_df = dcf.attacking_or_defending(gameweeks_df, db_connection)
 
-    dcf.form_against_next_opponent(gameweeks_df, gameweeks_df)
+    head_to_head = dcf.head_to_head_index(gameweeks_df)
+
+    dcf.form_against_next_opponent(gameweeks_df, head_to_head=head_to_head)
+
+    bounds = dcf.shifted_points_range(gameweeks_df)
+
+    gws.save_gameweeks(gameweeks_df, path=path)
+
+    os.makedirs(path + 'CSV/checkpoints', exist_ok=True)
+    with open(checkpoint_path, 'wb') as file:
+        pickle.dump({'head_to_head': head_to_head, 'bounds': bounds}, file)
+
+
+def incremental_concatenation(changes, gameweeks_df, checkpoint, path=None):
+    """
+    Updates the saved all_gameweeks with the observations that were added or changed in the current season.
+
+    :param changes: Dataframe of the clean observations that were added or changed.
+    :param gameweeks_df: The saved all_gameweeks dataframe.
+    :param checkpoint: The checkpoint of the last run, with the 'head_to_head' index and shifted points 'bounds'. It is
+                       updated in place.
+    :param path: The project directory to save the all_gameweeks to. Default is None, which uses the projects
+                 directory.
+    :return: Whether the update was made, or False if a full concatenation is needed.
+    """
+    changes = changes.copy()
+    shift_points = changes['shift_points'].dropna()
+    if not shift_points.empty and shift_points.min() < checkpoint['bounds'][0]:
+        return False
+    if changes.empty:
+        return True
+    bounds = (checkpoint['bounds'][0], max([checkpoint['bounds'][1]] + list(shift_points)))
+
+    changes['date_of_match'] = changes['date_of_match'].astype(str)
+    changed = dcf.match_keys(gameweeks_df).isin(dcf.match_keys(changes))
+    new_observations = changes[~dcf.match_keys(changes).isin(dcf.match_keys(gameweeks_df))]
+    gameweeks_df = gameweeks_df[~changed].copy()
+
+    # every defence type of the defenders that played is re-decided with their new appearances
+    defenders = changes[changes['position'] == 'DEF']['name'].unique()
+    defenders_df = gameweeks_df[gameweeks_df['name'].isin(defenders)][['name', 'position', 'creativity']]
+    defenders_df = pd.concat([defenders_df.replace({'position': {'AttDEF': 'DEF', 'DefDEF': 'DEF'}}),
+                              changes[['name', 'position', 'creativity']]])
+    types = dcf.defender_types(defenders_df)
+    for dataframe in (gameweeks_df, changes):
+        is_defender = dataframe['position'].isin(['DEF', 'AttDEF', 'DefDEF']) & dataframe['name'].isin(types.index)
+        dataframe.loc[is_defender, 'position'] = dataframe.loc[is_defender, 'name'].map(types)
+
+    # the form against an opponent changes for every observation facing an opponent a player has played again
+    checkpoint['head_to_head'] = dcf.update_head_to_head_index(checkpoint['head_to_head'], new_observations)
+    played_again = pd.MultiIndex.from_arrays([new_observations['name'], new_observations['opponent_team']])
+    facing = pd.MultiIndex.from_arrays([gameweeks_df['name'], gameweeks_df['shift_opponent']]).isin(played_again)
+    facing_df = gameweeks_df[facing].copy()
+    for dataframe in (facing_df, changes):
+        dcf.form_against_next_opponent(dataframe, head_to_head=checkpoint['head_to_head'])
+    gameweeks_df.loc[facing] = facing_df
 
-    dcf.shifted_points_range(gameweeks_df)
+    checkpoint['bounds'] = dcf.shifted_points_range(changes, bounds)
 
-    gameweeks_df.to_csv(path + 'CSV/all_gameweeks.csv', index=False)
+    gws.save_gameweeks(pd.concat([gameweeks_df, changes])[gameweeks_df.columns], path=path)
+    return True
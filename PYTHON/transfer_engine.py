@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from itertools import combinations
+from collections import Counter
+import PYTHON.best_predicted_squad as bps
+
+position_order = list(bps.squad_quotas)
+
+
+def transfer_index(predictions, players=None):
+    """
+    Indexes the players once so transfers can be looked up without searching the predictions. Each player gets a row
+    in the arrays, and the players in each position are kept in an array sorted by their score, best first. A player
+    with two fixtures gets the score of both.
+
+    :param predictions: The predictions dataframe.
+    :param players: Dataframe of the name, value, position and plays_for of every player that can be in a squad,
+                    including the ones without a prediction, who score 0. Default is None, which uses the players in
+                    the predictions.
+    :return: Dictionary of the 'names', 'value', 'position', 'team' and 'score' arrays, the 'row' of each name and the
+             rows 'by_position', indexed by position code.
+    """
+    scores = bps.squad_score(predictions['predicted_point_range'], predictions['prob_3']).groupby(
+        predictions['name']).sum()
+    players = pd.concat([predictions, players]) if players is not None else predictions
+    players = players.drop_duplicates(subset=['name']).reset_index(drop=True)
+
+    score = scores.reindex(players['name']).fillna(0).to_numpy()
+    position = players['position'].replace({'AttDEF': 'DEF', 'DefDEF': 'DEF'}).map(
+        {position: code for code, position in enumerate(position_order)}).to_numpy()
+    by_position = [np.flatnonzero(position == code)[np.argsort(-score[position == code], kind='stable')]
+                   for code in range(len(position_order))]
+    return {'names': players['name'].to_numpy(), 'value': players['value'].to_numpy(), 'position': position,
+            'team': pd.factorize(players['plays_for'])[0], 'score': score,
+            'row': {name: row for row, name in enumerate(players['name'])}, 'by_position': by_position}
+
+
+def in_combinations(index, squad_rows, positions, candidates_per_position):
+    """
+    Every combination of players not in the squad that fills the given positions, from the best
+    candidates_per_position players in each position.
+
+    :param index: The transfer index.
+    :param squad_rows: Array of the rows of the squad.
+    :param positions: Tuple of the position codes of the players going out, sorted.
+    :param candidates_per_position: The number of players in each position to combine.
+    :return: Array of the rows of each combination, with shape (number_of_combinations, len(positions)).
+    """
+    combos = np.zeros((1, 0), dtype=int)
+    for code, count in sorted(Counter(positions).items()):
+        candidates = index['by_position'][code]
+        candidates = candidates[~np.isin(candidates, squad_rows)][:candidates_per_position]
+        part = candidates[np.array(list(combinations(range(len(candidates)), count)), dtype=int).reshape(-1, count)]
+        # every combination so far with every combination of this position
+        combos = np.hstack([np.repeat(combos, len(part), axis=0), np.tile(part, (len(combos), 1))])
+    return combos
+
+
+def within_team_limit(team_counts, out_teams, in_teams):
+    """
+    Checks that a squad still has at most 3 players from each team after each transfer. Only the teams of the players
+    coming in can go over the limit, so only their counts are checked.
+
+    :param team_counts: Array of the number of players in the squad from each team.
+    :param out_teams: Array of the teams of the players going out in each transfer, one row for each transfer.
+    :param in_teams: Array of the teams of the players coming in in each transfer, one row for each transfer.
+    :return: Boolean array of whether each transfer is within the limit.
+    """
+    new_counts = (team_counts[in_teams] + (in_teams[:, :, None] == in_teams[:, None, :]).sum(axis=2) -
+                  (in_teams[:, :, None] == out_teams[:, None, :]).sum(axis=2))
+    return new_counts.max(axis=1, initial=0) <= 3
+
+
+def best_transfers(index, squad, bank, max_transfers=3, top_n=10, candidates_per_position=25, min_transfers=1):
+    """
+    Finds the best transfers for a squad by evaluating every legal combination of up to max_transfers transfers at
+    once. The players going out are every combination from the squad, and the players coming in are every combination
+    of the best candidates_per_position players in the same positions that are not in the squad. A transfer is legal if
+    the players coming in cost at most the bank plus the value of the players going out, and the squad still has at
+    most 3 players from each team.
+
+    :param index: The transfer index from transfer_index.
+    :param squad: List of the names of the players in the squad.
+    :param bank: The money in the bank, in the same units as the values.
+    :param max_transfers: The most transfers to make at once.
+    :param top_n: The number of transfers to return.
+    :param candidates_per_position: The number of players in each position that can come in.
+    :param min_transfers: The fewest transfers to make at once.
+    :return: Dataframe of the best transfers, best first, with the players going 'out' and coming 'in', the number of
+             'transfers', the 'gain' in squad score and the 'bank' left after the transfers.
+    """
+    missing = [name for name in squad if name not in index['row']]
+    if missing:
+        raise ValueError('Players not found: {}'.format(', '.join(missing)))
+    squad_rows = np.array([index['row'][name] for name in squad])
+    team_counts = np.bincount(index['team'][squad_rows], minlength=index['team'].max() + 1)
+    if team_counts.max() > 3:
+        raise ValueError('Invalid team distribution in squad list. Must have 3 or less players from the same team.')
+
+    value, score, team = index['value'], index['score'], index['team']
+    options = []
+    for number_of_transfers in range(min_transfers, max_transfers + 1):
+        out_combos = np.array(list(combinations(squad_rows, number_of_transfers)), dtype=int)
+        out_positions = np.sort(index['position'][out_combos], axis=1)
+        for positions in np.unique(out_positions, axis=0):
+            outs = out_combos[(out_positions == positions).all(axis=1)]
+            ins = in_combinations(index, squad_rows, tuple(positions), candidates_per_position)
+            if not len(ins):
+                continue
+
+            gain = score[ins].sum(axis=1)[None, :] - score[outs].sum(axis=1)[:, None]
+            bank_left = bank + value[outs].sum(axis=1)[:, None] - value[ins].sum(axis=1)[None, :]
+            out_index, in_index = np.nonzero((bank_left >= 0) & (gain > 0))
+            pair_gains = gain[out_index, in_index]
+
+            # the team limit is only checked on the best pairs, taking more until top_n of them are legal
+            size = top_n
+            while True:
+                best = np.argpartition(-pair_gains, size)[:size] if size < len(pair_gains) else np.arange(
+                    len(pair_gains))
+                best = best[np.argsort(-pair_gains[best], kind='stable')]
+                best = best[within_team_limit(team_counts, team[outs[out_index[best]]], team[ins[in_index[best]]])]
+                if len(best) >= top_n or size >= len(pair_gains):
+                    break
+                size *= 4
+
+            options += [(gain[o, i], tuple(index['names'][outs[o]]), tuple(index['names'][ins[i]]),
+                         number_of_transfers, bank_left[o, i]) for o, i in zip(out_index[best[:top_n]],
+                                                                                in_index[best[:top_n]])]
+
+    options = sorted(options, key=lambda option: -option[0])[:top_n]
+    return pd.DataFrame([{'out': out, 'in': players_in, 'transfers': transfers, 'gain': gain, 'bank': bank_left}
+                         for gain, out, players_in, transfers, bank_left in options],
+                        columns=['out', 'in', 'transfers', 'gain', 'bank'])
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import PYTHON.best_predicted_squad as bps
+
+# rough number of points in the middle of each predicted point range, used to turn the probabilities into expected
+# points that transfer hits can be taken off
+range_points = {0: 0, 1: 2.5, 2: 7.5, 3: 13}
+
+# points taken off for each transfer over the free transfers, and the most free transfers that can be saved up
+hit_cost = 4
+max_free_transfers = 2
+
+position_order = list(bps.squad_quotas)
+
+
+def expected_points(predictions):
+    """
+    Gets the expected points of each prediction from the probability of each point range.
+
+    :param predictions: The predictions dataframe.
+    :return: Series of the expected points.
+    """
+    return sum(predictions['prob_{}'.format(point_range)] * points for point_range, points in range_points.items())
+
+
+def next_free_transfers(free_transfers, transfers_made):
+    """
+    Gets the free transfers for the next round. An unused free transfer is saved, up to the maximum.
+
+    :param free_transfers: The free transfers this round.
+    :param transfers_made: The transfers made this round.
+    :return: The free transfers next round.
+    """
+    return min(max_free_transfers, free_transfers - min(transfers_made, free_transfers) + 1)
+
+
+def planner_tables(predictions, players):
+    """
+    Builds the arrays the planner searches over, with a row for each round and a column for each player.
+
+    :param predictions: The predictions dataframe of every upcoming round, with a 'round' column.
+    :param players: Dataframe of the name, value, position and plays_for of every player that can be in a squad.
+    :return: (players, rounds, points_array, prob_3_array), where a player without a prediction in a round has 0.
+    """
+    players = players.drop_duplicates(subset=['name']).reset_index(drop=True)
+    rounds = sorted(predictions['round'].unique())
+    predictions = predictions.assign(expected_points=expected_points(predictions))
+    # a player with two fixtures in a round gets the points of both
+    per_round = predictions.groupby(['round', 'name'])[['expected_points', 'prob_3']].sum()
+    points = np.zeros((len(rounds), len(players)))
+    probs = np.zeros((len(rounds), len(players)))
+    for i, next_round in enumerate(rounds):
+        round_predictions = per_round.loc[next_round].reindex(players['name']).fillna(0)
+        points[i] = round_predictions['expected_points'].to_numpy()
+        probs[i] = round_predictions['prob_3'].to_numpy()
+    return players, rounds, points, probs
+
+
+def plan_transfers(predictions, current_squad, free_transfers=1, bank=0, players=None, max_transfers=2,
+                   moves_per_round=6, replacements_per_player=5):
+    """
+    Plans the transfers over every upcoming round in the predictions that score the most points in total, taking off
+    hit_cost points for every transfer over the free transfers. Each round scores the expected points of its best
+    starting 11 with the captain doubled, picked the same way as the best squads.
+
+    The rounds are searched with dynamic programming over the state (round, squad, free transfers, bank), so a squad
+    reached by different transfer orders is only planned from once. At each state the replacements_per_player best
+    replacements of each player, and the best ones that are cheaper than them, are the candidate transfers. Only the
+    moves_per_round best single transfers and pairs of them, by the expected points they add over the rest of the
+    horizon, are tried. A pair only has to be affordable and add points as a whole, so a downgrade can pay for an
+    upgrade, and a move that would cost a hit is only tried if it adds more points than the hit costs. Players are sold
+    for their current value.
+
+    :param predictions: The predictions dataframe of every upcoming round, with a 'round' column.
+    :param current_squad: List of the names of the 15 players in the current squad.
+    :param free_transfers: The free transfers for the first round.
+    :param bank: The money in the bank, in the same units as the values.
+    :param players: Dataframe of the name, value, position and plays_for of every player that can be in a squad.
+                    Default is None, which uses the players in the predictions. It must include the current squad.
+    :param max_transfers: The most transfers to make in a single round, from 0 to 2.
+    :param moves_per_round: The number of single transfers and of pairs of transfers to try at each state.
+    :param replacements_per_player: The number of replacements of each player, and of cheaper replacements, to build
+                                    the transfers from.
+    :return: Dictionary with the 'total_points' and the 'plan', a list with a dictionary for each round of the
+             transfers 'out' and 'in', the 'hit' taken, the 'free_transfers' and 'bank' before the transfers, and the
+             'points' of the squad that round.
+    """
+    if players is None:
+        players = predictions.sort_values(by='round')[['name', 'value', 'position', 'plays_for']]
+    players, rounds, points, probs = planner_tables(predictions, players)
+
+    index = pd.Series(range(len(players)), index=players['name'])
+    missing = [name for name in current_squad if name not in index]
+    if missing:
+        raise ValueError('Players not found: {}'.format(', '.join(missing)))
+
+    value = players['value'].to_numpy()
+    position = players['position'].map({position: i for i, position in enumerate(position_order)}).to_numpy()
+    team = pd.factorize(players['plays_for'])[0]
+    # expected points of each player from each round to the end of the horizon
+    horizon = np.cumsum(points[::-1], axis=0)[::-1]
+    # the players in each position, best over the rest of the horizon first, for each round
+    ranked = [[np.flatnonzero(position == code)[np.argsort(-horizon[r][position == code], kind='stable')]
+               for code in range(len(position_order))] for r in range(len(rounds))]
+
+    round_points_cache = {}
+
+    def round_points(r, squads):
+        # the starting 11s of every squad that has not been scored yet are picked in one batch
+        new_squads = [squad for squad in dict.fromkeys(squads) if (r, squad) not in round_points_cache]
+        if new_squads:
+            orders = np.array([sorted(squad, key=lambda player: (position[player], player)) for squad in new_squads])
+            squad_points = points[r, orders]
+            starting, captains, _ = bps.starting_11s(squad_points, probs[r, orders])
+            scores = (squad_points * starting).sum(axis=1) + squad_points[np.arange(len(new_squads)), captains]
+            round_points_cache.update(((r, squad), score) for squad, score in zip(new_squads, scores))
+        return [round_points_cache[(r, squad)] for squad in squads]
+
+    def moves(r, squad, bank):
+        squad_list = list(squad)
+        in_squad = np.zeros(len(players), dtype=bool)
+        in_squad[squad_list] = True
+        team_counts = np.bincount(team[squad_list], minlength=team.max() + 1)
+
+        # the replacements_per_player best replacements of each player, and the best ones that are cheaper than them,
+        # whether or not they can be afforded or add points on their own, so a downgrade can pay for an upgrade
+        legs_out, legs_in = [], []
+        for code, position_ranked in enumerate(ranked[r]):
+            options = position_ranked[~in_squad[position_ranked]]
+            for out in squad_list:
+                if position[out] == code:
+                    chosen = dict.fromkeys(options[:replacements_per_player].tolist() +
+                                           options[value[options] < value[out]][:replacements_per_player].tolist())
+                    legs_out += [out] * len(chosen)
+                    legs_in += list(chosen)
+        legs_out, legs_in = np.array(legs_out), np.array(legs_in)
+        gain = horizon[r, legs_in] - horizon[r, legs_out]
+        cost = value[legs_in] - value[legs_out]
+        # a player coming in from a different team can only join a team with fewer than 3 players in the squad
+        new_count = team_counts[team[legs_in]] + (team[legs_in] != team[legs_out])
+
+        singles = []
+        if max_transfers >= 1:
+            single = np.flatnonzero((gain > 0) & (cost <= bank) & (new_count <= 3))
+            singles = [(gain[i], (int(legs_out[i]), ), (int(legs_in[i]), ))
+                       for i in single[np.argsort(-gain[single], kind='stable')][:moves_per_round]]
+
+        pairs = []
+        if max_transfers >= 2:
+            first, second = np.triu_indices(len(legs_in), 1)
+            pair_gain = gain[first] + gain[second]
+            valid = ((pair_gain > 0) & (legs_out[first] != legs_out[second]) & (legs_in[first] != legs_in[second]) &
+                     (cost[first] + cost[second] <= bank))
+            first, second, pair_gain = first[valid], second[valid], pair_gain[valid]
+            # the squad count of each incoming players team after both transfers
+            valid = np.ones(len(first), dtype=bool)
+            for this, other in [(first, second), (second, first)]:
+                this_team = team[legs_in[this]]
+                valid &= (team_counts[this_team] + 1 - (team[legs_out[this]] == this_team) +
+                          (team[legs_in[other]] == this_team) - (team[legs_out[other]] == this_team)) <= 3
+            first, second, pair_gain = first[valid], second[valid], pair_gain[valid]
+            best = np.argsort(-pair_gain, kind='stable')[:moves_per_round]
+            pairs = [(pair_gain[i], (int(legs_out[first[i]]), int(legs_out[second[i]])),
+                      (int(legs_in[first[i]]), int(legs_in[second[i]]))) for i in best]
+        return [(0, (), ())] + singles + pairs
+
+    memo = {}
+
+    def best_plan(r, squad, free, bank):
+        if r == len(rounds):
+            return 0, []
+        key = (r, squad, free, bank)
+        if key in memo:
+            return memo[key]
+        best = None
+        tried = [(outs, ins, hit_cost * max(0, len(outs) - free)) for gain, outs, ins in moves(r, squad, bank)
+                 if not outs or gain > hit_cost * max(0, len(outs) - free)]
+        new_squads = [tuple(sorted(set(squad) - set(outs) | set(ins))) for outs, ins, _ in tried]
+        for (outs, ins, hit), new_squad, squad_points in zip(tried, new_squads, round_points(r, new_squads)):
+            new_bank = bank + value[list(outs)].sum() - value[list(ins)].sum()
+            this_round = squad_points - hit
+            future, plan = best_plan(r + 1, new_squad, next_free_transfers(free, len(outs)), new_bank)
+            if best is None or this_round + future > best[0]:
+                best = (this_round + future, [(outs, ins, hit, free, bank, this_round + hit)] + plan)
+        memo[key] = best
+        return best
+
+    total, plan = best_plan(0, tuple(sorted(int(player) for player in index[current_squad])), free_transfers, bank)
+    names = players['name'].to_numpy()
+    return {'total_points': total,
+            'plan': [{'round': next_round, 'out': list(names[list(outs)]), 'in': list(names[list(ins)]), 'hit': hit,
+                      'free_transfers': free, 'bank': int(bank), 'points': round_score}
+                     for next_round, (outs, ins, hit, free, bank, round_score) in zip(rounds, plan)]}
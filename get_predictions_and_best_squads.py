@@ -1,19 +1,23 @@
-from PYTHON.data_collection import get_data
-from PYTHON.current_season_cleaner import current_season_cleaner
-from PYTHON.season_concatenator import season_concatenator
-from PYTHON.getting_next_fixtures import get_next_fixtures
-from PYTHON.predicting_next_fixtures import get_predictions
-from PYTHON.best_predicted_squad import get_best_squad
+import PYTHON.data_cleaning_functions as dcf
+from PYTHON.pipeline_runner import run_pipeline
+from PYTHON.pipeline_instrumentation import PipelineTrace
 
-get_data()
+path = '/Users/danielheaver/Desktop/projects/fantasy_football_predictions/'
 
-current_season_cleaner()
+# set to True to record the wall time, CPU time, peak memory and rows of each stage and each dcf call, saved to
+# pipeline_trace.json as a Chrome trace and printed as a summary table
+instrument = False
 
-season_concatenator()
+# stages to run even if their inputs have not changed, e.g. ['get_predictions'] after saving a new model
+force = []
 
-get_next_fixtures()
+trace = PipelineTrace(enabled=instrument)
 
-get_predictions()
+with trace.functions(dcf, 'dcf'):
+    statuses = run_pipeline(force=force, trace=trace)
 
-for constraint in {'budget', 'team', 'all', 'none'}:
-    get_best_squad(constraint)
+print(statuses)
+
+if instrument:
+    trace.save(path + 'pipeline_trace.json')
+    print(trace.summary().to_string(index=False))
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+import PYTHON.data_cleaning_functions as dcf
+
+
+def loop_mean_statistics(dataframe):
+    """
+    The per-row mean_statistics the grouped version replaced, kept to check the means are the same.
+
+    :param dataframe: A gameweeks dataframe.
+    """
+    dataframe.sort_values(by='date_of_match', ascending=False, inplace=True)
+    means = {mean: [] for mean in dcf.rolling_statistics.values()}
+    for player, date in zip(dataframe['name'], dataframe['date_of_match']):
+        players_df = dataframe[(dataframe['name'] == player) & (dataframe['date_of_match'] < date)][:3]
+        for statistic, mean in dcf.rolling_statistics.items():
+            means[mean].append(players_df[statistic].mean())
+    for statistic, mean in dcf.rolling_statistics.items():
+        dataframe['mean_' + mean] = means[mean]
+        dataframe['mean_' + mean].fillna(dataframe[statistic], inplace=True)
+
+
+def gameweeks_fixture():
+    """
+    Makes a small gameweeks dataframe with float statistics whose rolling means round differently depending on the
+    order they are summed in, a player with two appearances on the same date and a player with a single appearance.
+    """
+    random = np.random.RandomState(0)
+    names = ['A'] * 8 + ['B'] * 6 + ['C']
+    dates = (list(pd.date_range('2020-09-12', periods=8, freq='7D')) +
+             list(pd.date_range('2020-09-13', periods=5, freq='7D')) + [pd.Timestamp('2020-10-11')] +
+             [pd.Timestamp('2020-09-20')])
+    dataframe = pd.DataFrame({'name': names, 'date_of_match': [date.date() for date in dates]})
+    for statistic in dcf.rolling_statistics:
+        dataframe[statistic] = np.round(random.uniform(0, 10, len(dataframe)), 1)
+    dataframe['adjusted_points'] = random.randint(-2, 15, len(dataframe))
+    return dataframe.sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def test_mean_statistics_matches_loop():
+    expected = gameweeks_fixture()
+    loop_mean_statistics(expected)
+    result = gameweeks_fixture()
+    dcf.mean_statistics(result)
+
+    means = ['mean_' + mean for mean in dcf.rolling_statistics.values()]
+    pd.testing.assert_frame_equal(result.sort_index()[means], expected.sort_index()[means], check_exact=True)
+
+
+def test_home_and_away_teams_needs_both_teams():
+    dataframe = pd.DataFrame({'fixture': [1, 1, 2], 'opponent_team': ['Arsenal', 'Chelsea', 'Everton'],
+                              'was_home': [True, False, True]})
+    with pytest.raises(ValueError, match=r'Fixtures \[2\]'):
+        dcf.home_and_away_teams(dataframe)
+
+    resolved = dataframe[dataframe['fixture'] == 1].copy()
+    dcf.home_and_away_teams(resolved)
+    assert list(resolved['home_team']) == ['Chelsea', 'Chelsea'] and list(resolved['away_team']) == ['Arsenal'] * 2
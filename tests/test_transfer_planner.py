@@ -0,0 +1,32 @@
+import pandas as pd
+from PYTHON.transfer_planner import plan_transfers
+
+
+def predictions_of(players):
+    """
+    Makes a round of predictions where each player scores prob_3 * 13 expected points.
+
+    :param players: List of (name, value, position, plays_for, prob_3).
+    :return: The predictions dataframe.
+    """
+    predictions = pd.DataFrame(players, columns=['name', 'value', 'position', 'plays_for', 'prob_3'])
+    predictions['prob_0'] = 1 - predictions['prob_3']
+    predictions[['prob_1', 'prob_2']] = 0.0
+    predictions['round'] = 1
+    return predictions
+
+
+def test_downgrade_pays_for_upgrade():
+    squad = ([('GK {}'.format(i), 50, 'GK', 'Team {}'.format(i), 0.3) for i in range(2)] +
+             [('DEF {}'.format(i), 50, 'DEF', 'Team {}'.format(i + 2), 0.3) for i in range(5)] +
+             [('MID {}'.format(i), 50, 'MID', 'Team {}'.format(i + 7), 0.3) for i in range(5)] +
+             [('FWD {}'.format(i), 50, 'FWD', 'Team {}'.format(i + 12), 0.3) for i in range(3)])
+    # the star forward can't be afforded on its own, and the cheap defender loses points on its own
+    replacements = [('Star FWD', 60, 'FWD', 'Team 15', 0.9), ('Cheap DEF', 40, 'DEF', 'Team 16', 0.25)]
+
+    result = plan_transfers(predictions_of(squad + replacements), [player[0] for player in squad], free_transfers=2,
+                            bank=0)
+
+    plan = result['plan'][0]
+    assert sorted(plan['in']) == ['Cheap DEF', 'Star FWD']
+    assert len(plan['out']) == 2 and plan['hit'] == 0